@@ -0,0 +1,25 @@
+import sys
+import os
+from configparser import ConfigParser
+
+
+# config.ini jest czytany tylko raz, ha_autogenerate i sensor_graph uzywaja tej samej sekcji [ha]
+
+def get_config_path():
+    if getattr(sys, 'frozen', False):
+        base_path = os.path.dirname(sys.executable)
+    else:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+
+    return os.path.join(base_path, "config.ini")
+
+# Wczytywanie pliku konfiguracyjnego
+config_path = get_config_path()
+config_object = ConfigParser()
+config_object.read(config_path)
+
+if "ha" not in config_object:
+    print("error config.ini!")
+    sys.exit(1)
+
+config = config_object["ha"]
@@ -0,0 +1,187 @@
+# Porownanie starego dispatchu (if/elif po prefiksach) z rejestrem updaterow.
+# Uruchomienie: python benchmarks/bench_dispatch.py [liczba_zdarzen]
+import os
+import sys
+import json
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_updaters import create_updater
+from entity_store import EntityState
+
+
+class FakeWidget:
+    def blockSignals(self, value):
+        pass
+
+    def setValue(self, value):
+        pass
+
+    def setText(self, value):
+        pass
+
+    def clear(self):
+        pass
+
+    def addItems(self, items):
+        pass
+
+    def setCurrentIndex(self, index):
+        pass
+
+
+class FakeCombo(FakeWidget):
+    pass
+
+
+def legacy_update_entity_state(entity_widgets, entity_info_types, eid, state_obj):
+    # kopia update_entity_state sprzed rejestru (bez print)
+    brightness_widget = entity_widgets.get((eid, "brightness"))
+    temp_widget = entity_widgets.get((eid, "temp"))
+    hue_widget = entity_widgets.get((eid, "hue"))
+    generic_widget = entity_widgets.get(eid)
+
+    itype = entity_info_types.get(eid, "")
+    state = state_obj.get("state")
+    attrs = state_obj.get("attributes", {})
+
+    if eid.startswith("light."):
+        if brightness_widget:
+            brightness = 0 if state == "off" else int(attrs.get("brightness", 0))
+            brightness_widget.blockSignals(True)
+            brightness_widget.setValue(brightness)
+            brightness_widget.blockSignals(False)
+        if temp_widget:
+            temp = attrs.get("color_temp")
+            if isinstance(temp, (int, float)):
+                temp_widget.blockSignals(True)
+                temp_widget.setValue(int(temp))
+                temp_widget.blockSignals(False)
+    elif eid.startswith("switch."):
+        if generic_widget:
+            generic_widget.setText("Off" if state == "on" else "On")
+    elif eid.startswith("cover."):
+        if generic_widget:
+            generic_widget.blockSignals(True)
+            generic_widget.setValue(int(attrs.get("current_position", 0)))
+            generic_widget.blockSignals(False)
+    elif eid.startswith("fan."):
+        if generic_widget:
+            generic_widget.blockSignals(True)
+            generic_widget.setValue(int(attrs.get("percentage", 0)))
+            generic_widget.blockSignals(False)
+    elif eid.startswith("sensor.") or eid.startswith("binary_sensor."):
+        if generic_widget:
+            if "doors" in itype or "window" in itype:
+                state = "Open" if state == "on" else "Closed"
+            generic_widget.setText(str(state))
+    elif eid.startswith("number."):
+        label = entity_widgets.get((eid, "label"))
+        if label:
+            try:
+                label.setText(f"{float(state):.0f}")
+            except ValueError:
+                label.setText(state)
+    elif eid.startswith("select."):
+        if isinstance(generic_widget, FakeCombo):
+            options = attrs.get("options", [])
+            generic_widget.blockSignals(True)
+            generic_widget.clear()
+            generic_widget.addItems(options)
+            if state in options:
+                generic_widget.setCurrentIndex(options.index(state))
+            generic_widget.blockSignals(False)
+
+
+def make_state(eid):
+    domain = eid.split(".", 1)[0]
+    attrs = {"friendly_name": eid}
+    state = "on"
+    if domain == "light":
+        attrs.update(brightness=random.randint(1, 255), color_temp=300)
+    elif domain in ("sensor", "number"):
+        state = str(round(random.random() * 100, 1))
+    elif domain == "select":
+        attrs["options"] = ["a", "b", "c"]
+        state = "b"
+    elif domain == "cover":
+        attrs["current_position"] = 40
+    elif domain == "fan":
+        attrs["percentage"] = 30
+    return {"entity_id": eid, "state": state, "attributes": attrs}
+
+
+def make_record(eid, state_obj):
+    record = EntityState(eid, state_obj["state"])
+    record.set_attributes(state_obj["attributes"])
+    return record
+
+
+def main():
+    events_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(base, "entities_list.json")) as f:
+        groups = json.load(f)
+
+    entity_widgets = {}
+    entity_info_types = {}
+    entity_updaters = {}
+    configured = []
+
+    for entities in groups.values():
+        for entity in entities:
+            eid = entity["entity_id"]
+            etype = entity["widget_type"]
+            itype = entity["info_type"]
+            configured.append(eid)
+            if etype == "light":
+                kind, key = "brightness", (eid, "brightness")
+            elif etype == "number":
+                kind, key = "label", (eid, "label")
+            else:
+                kind, key = "generic", eid
+            widget = FakeCombo() if etype == "select" else FakeWidget()
+            entity_widgets[key] = widget
+            entity_info_types[key if kind != "label" else eid] = itype
+            updater = create_updater(eid, kind, widget, itype)
+            if updater:
+                entity_updaters.setdefault(eid, []).append(updater)
+
+    # w trybie "events" wiekszosc zdarzen dotyczy encji bez widgetu
+    unknown = [f"sensor.unknown_{i}" for i in range(len(configured) * 9)]
+    scenarios = [
+        ("subscribe_entities (configured only)", configured),
+        ("subscribe_events (90% unknown)", configured + unknown),
+    ]
+
+    for title, pool in scenarios:
+        random.seed(1)
+        events = [(eid, make_state(eid)) for eid in random.choices(pool, k=events_count)]
+        # updaters get EntityState records, made in the websocket thread before dispatch;
+        # made directly, the store returns None for repeated states that change nothing visible
+        records = [(eid, make_record(eid, state_obj)) for eid, state_obj in events]
+
+        def run_legacy():
+            for eid, state_obj in events:
+                legacy_update_entity_state(entity_widgets, entity_info_types, eid, state_obj)
+
+        def run_registry():
+            for eid, state_obj in records:
+                updaters = entity_updaters.get(eid)
+                if updaters is None:
+                    continue
+                for updater in updaters:
+                    updater.update(state_obj)
+
+        legacy = min(timeit.repeat(run_legacy, number=1, repeat=5))
+        registry = min(timeit.repeat(run_registry, number=1, repeat=5))
+        print(f"{title}: {events_count} events")
+        print(f"  legacy if/elif: {legacy * 1000:.1f} ms ({events_count / legacy:.0f} ev/s)")
+        print(f"  registry:       {registry * 1000:.1f} ms ({events_count / registry:.0f} ev/s)")
+        print(f"  speedup:        {legacy / registry:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Parsowanie odpowiedzi /api/history/period: stara petla (pelny payload) vs numpy (minimal_response).
+# Uruchomienie: python benchmarks/bench_history_parse.py [liczba_punktow]
+import os
+import sys
+import json
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_data import parse_history
+
+
+def make_response(points, minimal, binary=False):
+    entity_id = "binary_sensor.door" if binary else "sensor.power_meter"
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    entries = []
+    for i in range(points):
+        changed = (start + timedelta(seconds=i, microseconds=random.randint(0, 999999))).isoformat()
+        if binary:
+            state = random.choice(["on", "off"])
+        else:
+            state = "unavailable" if i % 1000 == 999 else str(round(random.uniform(100, 3000), 1))
+        if minimal and i > 0:
+            entries.append({"state": state, "last_changed": changed})
+        else:
+            entries.append({
+                "entity_id": entity_id,
+                "state": state,
+                "attributes": {"unit_of_measurement": "W", "device_class": "power", "friendly_name": "Power meter"},
+                "last_changed": changed,
+                "last_updated": changed,
+            })
+    return json.dumps([entries])
+
+
+def legacy_parse(data, is_binary):
+    # kopia petli z get_sensor_history sprzed numpy + .timestamp() z update_plot
+    timestamps, values = [], []
+    for entry in data[0]:
+        try:
+            timestamp = datetime.fromisoformat(entry['last_updated'].replace('Z', '+00:00'))
+            state_str = entry['state'].lower()
+            if is_binary:
+                state_map = {"on": 1, "off": 0, "open": 1, "closed": 0}
+                if state_str in state_map:
+                    value = state_map[state_str]
+                else:
+                    continue
+            else:
+                value = float(entry['state'])
+            timestamps.append(timestamp)
+            values.append(value)
+        except (ValueError, KeyError):
+            continue
+    return [ts.timestamp() for ts in timestamps], values
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    random.seed(1)
+
+    for is_binary in (False, True):
+        full = make_response(points, minimal=False, binary=is_binary)
+        minimal = make_response(points, minimal=True, binary=is_binary)
+
+        legacy = min(timeit.repeat(lambda: legacy_parse(json.loads(full), is_binary), number=1, repeat=5))
+        vectorized = min(timeit.repeat(lambda: parse_history(json.loads(minimal)[0], is_binary), number=1, repeat=5))
+        parse_only = min(timeit.repeat(lambda data=json.loads(minimal)[0]: parse_history(data, is_binary), number=1, repeat=5))
+
+        print(f"{'binary' if is_binary else 'numeric'} sensor, {points} points")
+        print(f"  payload: full {len(full) / 1024:.0f} KiB, minimal_response {len(minimal) / 1024:.0f} KiB")
+        print(f"  legacy loop (full payload):   {legacy * 1000:.1f} ms")
+        print(f"  numpy (minimal payload):      {vectorized * 1000:.1f} ms (parse only {parse_only * 1000:.1f} ms)")
+        print(f"  speedup:                      {legacy / vectorized:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# Zestaw benchmarkow goracych sciezek panelu, bez ekranu (QT_QPA_PLATFORM=offscreen) i bez polaczenia z HA.
+# Wyniki ida do pliku JSON i sa porownywane z zapisanym baseline (najlepiej zmierzonym na docelowym RPi).
+# Uruchomienie:
+#   python benchmarks/run_benchmarks.py                      (porownanie z benchmarks/baseline.json)
+#   python benchmarks/run_benchmarks.py --save-baseline      (aktualny wynik staje sie baseline)
+#   python benchmarks/run_benchmarks.py --only update --repeat 3 --threshold 15
+import os
+import sys
+import json
+import time
+import random
+import timeit
+import argparse
+import platform
+from datetime import datetime
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, BENCH_DIR)
+# style.qss and entities_list.json are opened relative to the working directory
+os.chdir(BASE_DIR)
+
+import numpy as np
+from PyQt5.QtCore import QT_VERSION_STR, QEvent
+from PyQt5.QtWidgets import QApplication
+
+app = QApplication(sys.argv)
+
+from app_config import config
+# importing sensor_graph opens and prunes the history cache, the user's real file is left alone
+config["history_cache"] = ""
+
+import ha_autogenerate
+import sensor_graph
+import ha_codec
+from entity_store import EntityStateStore
+from history_data import parse_history
+from bench_history_parse import make_response
+
+CONFIG_SIZES = (50, 200, 1000)
+HISTORY_SIZES = (1000, 10000, 100000)
+PLOT_SIZES = (1000, 10000, 100000)
+UPDATES_PER_DOMAIN = 2000
+
+
+class BenchmarkUI(ha_autogenerate.HAControlUI):
+    # panel with a generated config, setup_widgets timed on its own; benchmarks never talk to HA
+    def __init__(self, groups):
+        self.groups = groups
+        super().__init__()
+
+    def setup_widgets(self):
+        self.entity_groups = self.groups
+        started = time.perf_counter()
+        super().setup_widgets()
+        self.setup_seconds = time.perf_counter() - started
+
+
+def generate_groups(count, zone_size=12):
+    # entities of entities_list.json repeated with new ids, zones of zone_size entities
+    with open(os.path.join(BASE_DIR, "entities_list.json")) as f:
+        templates = [entity for entities in json.load(f).values() for entity in entities]
+    groups = {}
+    for index in range(count):
+        template = templates[index % len(templates)]
+        entity = dict(template, entity_id=f"{template['entity_id']}_{index}", name=f"{template['name']} {index}")
+        groups.setdefault(f"Zone {index // zone_size}", []).append(entity)
+    return groups
+
+
+def state_variants(eid):
+    # two states of one entity that render differently, updates alternate between them
+    domain = eid.split(".", 1)[0]
+    if domain == "light":
+        return [{"state": "on", "attributes": {"brightness": 40, "color_temp": 250, "hs_color": [10, 100]}},
+                {"state": "on", "attributes": {"brightness": 200, "color_temp": 350, "hs_color": [200, 100]}}]
+    if domain in ("switch", "binary_sensor"):
+        return [{"state": "on", "attributes": {}}, {"state": "off", "attributes": {}}]
+    if domain == "cover":
+        return [{"state": "open", "attributes": {"current_position": 20}},
+                {"state": "open", "attributes": {"current_position": 80}}]
+    if domain == "fan":
+        return [{"state": "on", "attributes": {"percentage": 20}}, {"state": "on", "attributes": {"percentage": 80}}]
+    if domain == "number":
+        attributes = {"min": 0, "max": 10, "step": 1}
+        return [{"state": "3.0", "attributes": attributes}, {"state": "7.0", "attributes": attributes}]
+    if domain == "select":
+        attributes = {"options": ["a", "b", "c"]}
+        return [{"state": "a", "attributes": attributes}, {"state": "b", "attributes": attributes}]
+    return [{"state": "21.5", "attributes": {"device_class": "temperature"}},
+            {"state": "22.5", "attributes": {"device_class": "temperature"}}]
+
+
+def dispose(widget):
+    # without a running event loop deleteLater alone never deletes, old panels would slow down the next ones
+    widget.deleteLater()
+    app.sendPostedEvents(None, QEvent.DeferredDelete)
+
+
+def best_of(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def bench_setup_widgets(results, repeat):
+    for layout in ("list", "tabs"):
+        ha_autogenerate.zone_layout = layout
+        for count in CONFIG_SIZES:
+            groups = generate_groups(count)
+            timings = []
+            for _ in range(repeat):
+                ui = BenchmarkUI(groups)
+                timings.append(ui.setup_seconds)
+                dispose(ui)
+            results[f"setup_widgets {layout} {count} entities"] = (min(timings) * 1000, "ms", True)
+    ha_autogenerate.zone_layout = "list"
+
+
+def bench_update_entity_state(results, repeat):
+    ui = BenchmarkUI(generate_groups(200))
+    by_domain = {}
+    for eid in sorted(ui.entity_updaters):
+        by_domain.setdefault(eid.split(".", 1)[0], []).append(eid)
+
+    store = EntityStateStore()
+    for domain, eids in sorted(by_domain.items()):
+        variants = {eid: [store.set_state(eid, dict(variant, entity_id=eid)) for variant in state_variants(eid)]
+                    for eid in eids}
+        rounds = max(UPDATES_PER_DOMAIN // len(eids), 2)
+        sequence = [(eid, variants[eid][index % 2]) for index in range(rounds) for eid in eids]
+
+        def run():
+            for eid, record in sequence:
+                ui.update_entity_state(eid, record)
+
+        seconds = best_of(run, repeat)
+        results[f"update_entity_state {domain}"] = (len(sequence) / seconds, "updates/s", False)
+    dispose(ui)
+
+
+def bench_on_message(results, repeat):
+    eids = [entity["entity_id"] for entities in generate_groups(200).values() for entity in entities]
+    watched = set(eids)
+    received = []
+
+    def on_state_update(eid, record):
+        received.append(eid)
+
+    entities_client = ha_autogenerate.HAWebSocketClient(on_state_update, entity_ids=watched,
+                                                        entity_states=EntityStateStore(watched))
+    entities_client.subscription_id = 2
+    events_client = ha_autogenerate.HAWebSocketClient(on_state_update, entity_states=EntityStateStore(watched))
+
+    now = time.time()
+    diffs, watched_events, other_events = [], [], []
+    for index in range(2000):
+        eid = eids[index % len(eids)]
+        variant = state_variants(eid)[index // len(eids) % 2]
+        diffs.append(json.dumps({"id": 2, "type": "event", "event": {"c": {eid: {
+            "+": {"s": variant["state"], "a": variant["attributes"], "lc": now, "c": "01MOCK"}}}}}))
+        for events, entity_id in ((watched_events, eid), (other_events, f"sensor.not_on_panel_{index}")):
+            new_state = {"entity_id": entity_id, "state": variant["state"],
+                         "attributes": dict(variant["attributes"], friendly_name=entity_id),
+                         "last_changed": "2024-01-01T12:00:00+00:00", "last_updated": "2024-01-01T12:00:00+00:00",
+                         "context": {"id": "01MOCK", "parent_id": None, "user_id": None}}
+            events.append(json.dumps({"id": 3, "type": "event", "event": {
+                "event_type": "state_changed", "time_fired": "2024-01-01T12:00:00+00:00", "origin": "LOCAL",
+                "data": {"entity_id": entity_id, "old_state": new_state, "new_state": new_state}}}))
+
+    cases = [
+        ("on_message subscribe_entities diff", entities_client, diffs),
+        ("on_message state_changed configured", events_client, watched_events),
+        ("on_message state_changed other entity", events_client, other_events),
+    ]
+    for name, client, messages in cases:
+        def run():
+            for message in messages:
+                client.on_message(None, message)
+
+        results[name] = (best_of(run, repeat) / len(messages) * 1e6, "us", True)
+        received.clear()
+
+    states = [dict(state_variants(eid)[0], entity_id=eid, last_changed="2024-01-01T12:00:00+00:00",
+                   last_updated="2024-01-01T12:00:00+00:00", context={"id": "01MOCK"})
+              for eid in eids + [f"sensor.not_on_panel_{index}" for index in range(800)]]
+    message = json.dumps({"id": 4, "type": "result", "success": True, "result": states})
+    results[f"on_message get_states {len(states)} entities"] = (
+        best_of(lambda: events_client.on_message(None, message), repeat) * 1000, "ms", True)
+
+
+def bench_history_parse(results, repeat):
+    # json + parse_history of a minimal_response payload, the part of get_sensor_history after the download
+    random.seed(1)
+    for points in HISTORY_SIZES:
+        payload = make_response(points, minimal=True)
+        seconds = best_of(lambda: parse_history(ha_codec.loads(payload)[0], False), repeat)
+        results[f"history parse {points} points"] = (seconds * 1000, "ms", True)
+
+
+def bench_update_plot(results, repeat):
+    window = sensor_graph.SensorChartWindow()
+    window.resize(1000, 600)
+    window.show()
+    app.processEvents()
+
+    now = time.time()
+    span = sensor_graph.RANGES[sensor_graph.DEFAULT_RANGE][1].total_seconds()
+    for is_binary in (False, True):
+        for points in PLOT_SIZES:
+            window.sensor_id = "binary_sensor.bench" if is_binary else "sensor.bench"
+            window.buffer = sensor_graph.SensorHistoryBuffer(sensor_graph.HISTORY_WINDOW)
+            window.is_binary = is_binary
+            window.range_index = sensor_graph.DEFAULT_RANGE
+            window.mode = "raw"
+            timestamps = np.linspace(now - span, now, points)
+            values = (np.arange(points) // 7 % 2).astype(float) if is_binary else np.sin(np.arange(points) / 50) * 10 + 20
+            window.buffer.extend(timestamps, values)
+
+            kind = "binary" if is_binary else "numeric"
+            update = best_of(window.update_plot, repeat)
+            paint = best_of(window.grab, repeat)
+            results[f"update_plot {kind} {points} points"] = (update * 1000, "ms", True)
+            results[f"chart paint {kind} {points} points"] = (paint * 1000, "ms", True)
+    window.hide()
+
+
+BENCHMARKS = [
+    ("setup_widgets", bench_setup_widgets),
+    ("update_entity_state", bench_update_entity_state),
+    ("on_message", bench_on_message),
+    ("history", bench_history_parse),
+    ("update_plot", bench_update_plot),
+]
+
+
+def compare(results, baseline, threshold):
+    # prints the table, returns the names of results worse than the baseline by more than threshold %
+    regressions = []
+    print(f"{'benchmark':<46}{'baseline':>12}{'now':>12}{'change':>9}")
+    for name, result in results.items():
+        value, unit, lower_is_better = result["value"], result["unit"], result["lower_is_better"]
+        old = baseline.get(name)
+        if old is None or not old["value"]:
+            print(f"{name:<46}{'-':>12}{value:>12.3f} {unit}")
+            continue
+        change = (value - old["value"]) / old["value"] * 100
+        worse = change > threshold if lower_is_better else change < -threshold
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:<46}{old['value']:>12.3f}{value:>12.3f}{change:>+8.1f}% {unit}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Panel benchmarks, compared with a saved baseline")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results.json"))
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--only", help="run only benchmarks whose name starts with this")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every benchmark, the best one counts")
+    parser.add_argument("--threshold", type=float, default=10, help="allowed slowdown in percent")
+    args = parser.parse_args()
+
+    # nothing may reach HA or overwrite the real snapshot while measuring
+    ha_autogenerate.HAWebSocketClient.connect = lambda self: False
+    ha_autogenerate.state_snapshot = ""
+    ha_autogenerate.app = app
+
+    raw = {}
+    for name, function in BENCHMARKS:
+        if args.only and not name.startswith(args.only):
+            continue
+        print(f"running {name}...")
+        function(raw, args.repeat)
+    results = {name: {"value": round(value, 4), "unit": unit, "lower_is_better": lower}
+               for name, (value, unit, lower) in raw.items()}
+
+    report = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "qt": QT_VERSION_STR,
+        "numpy": np.__version__,
+        "json_codec": ha_codec.codec_name,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved["results"]
+        print(f"baseline: {saved['time']}, {saved['platform']}, python {saved['python']}, "
+              f"json codec {saved.get('json_codec', 'json')}")
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0f}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import time
+import threading
+from collections import deque
+
+
+# Kolejka komend call_service. Kazda wyslana komenda czeka na swoj "result" (po id wiadomosci).
+# Komenda do tej samej encji/atrybutu zastepuje poprzednia, ktora jeszcze nie wyszla.
+# Bez polaczenia komendy czekaja i sa wysylane ponownie po zalogowaniu.
+
+class Command:
+    __slots__ = ("key", "domain", "service", "entity_id", "data", "msg_id",
+                 "created", "sent_at", "attempts", "on_done")
+
+    def __init__(self, key, domain, service, entity_id, data, on_done):
+        self.key = key
+        self.domain = domain
+        self.service = service
+        self.entity_id = entity_id
+        self.data = data
+        self.msg_id = None
+        self.created = time.monotonic()
+        self.sent_at = None
+        self.attempts = 0
+        # on_done(command, success, error), not called for commands replaced by a newer one
+        self.on_done = on_done
+
+    def payload(self):
+        service_data = dict(self.data)
+        service_data["entity_id"] = self.entity_id
+        return {
+            "type": "call_service",
+            "domain": self.domain,
+            "service": self.service,
+            "service_data": service_data,
+        }
+
+
+class CommandQueue:
+    def __init__(self, send, next_id, ack_timeout=5.0, max_attempts=2, max_age=30.0):
+        # send(payload) -> False when there is no connection, next_id() -> new message id
+        self.send = send
+        self.next_id = next_id
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.waiting = {}       # key -> Command not sent yet (offline)
+        self.in_flight = {}     # msg_id -> Command sent, no result yet
+        self.latest = {}        # key -> newest Command, older ones are superseded
+        self.online = False
+        # round-trip times in seconds of the last acknowledged commands
+        self.round_trips = deque(maxlen=200)
+
+    def submit(self, domain, service, entity_id, data=None, key=None, on_done=None):
+        command = Command(key or (entity_id, service), domain, service, entity_id, data or {}, on_done)
+        with self.lock:
+            self.latest[command.key] = command
+            # an unsent command with the same key is simply replaced
+            self.waiting.pop(command.key, None)
+            if not self.online or not self.transmit(command):
+                self.waiting[command.key] = command
+        return command
+
+    def transmit(self, command):
+        # called with the lock held
+        command.msg_id = self.next_id()
+        command.sent_at = time.monotonic()
+        command.attempts += 1
+        payload = command.payload()
+        payload["id"] = command.msg_id
+        if not self.send(payload):
+            return False
+        self.in_flight[command.msg_id] = command
+        return True
+
+    def handle_result(self, msg):
+        # True = the result belonged to a command
+        with self.lock:
+            command = self.in_flight.pop(msg.get("id"), None)
+            if command is None:
+                return False
+            self.round_trips.append(time.monotonic() - command.sent_at)
+        if msg.get("success"):
+            self.finish(command, True, None)
+        else:
+            error = msg.get("error") or {}
+            self.finish(command, False, error.get("message") or error.get("code") or "error")
+        return True
+
+    def finish(self, command, success, error):
+        with self.lock:
+            if self.latest.get(command.key) is not command:
+                return
+            del self.latest[command.key]
+        if command.on_done:
+            command.on_done(command, success, error)
+
+    def pending(self, command):
+        # True until the result (or failure) of this command, False once a newer one with the same key replaced it
+        with self.lock:
+            return self.latest.get(command.key) is command
+
+    def check_timeouts(self):
+        # called periodically: commands without an answer are sent again, then reported as failed
+        now = time.monotonic()
+        failed = []
+        with self.lock:
+            for msg_id, command in list(self.in_flight.items()):
+                if now - command.sent_at < self.ack_timeout:
+                    continue
+                del self.in_flight[msg_id]
+                if self.latest.get(command.key) is not command:
+                    continue
+                if command.attempts >= self.max_attempts:
+                    failed.append(command)
+                elif not (self.online and self.transmit(command)):
+                    self.waiting[command.key] = command
+            for key, command in list(self.waiting.items()):
+                if now - command.created > self.max_age:
+                    del self.waiting[key]
+                    failed.append(command)
+        for command in failed:
+            self.finish(command, False, "no answer from HA")
+
+    def connected(self):
+        # after auth_ok: commands from the offline time (and unanswered ones) are sent again
+        with self.lock:
+            self.online = True
+            now = time.monotonic()
+            replay = list(self.waiting.values())
+            self.waiting.clear()
+            expired = []
+            for command in sorted(replay, key=lambda command: command.created):
+                if now - command.created > self.max_age:
+                    expired.append(command)
+                elif not self.transmit(command):
+                    self.waiting[command.key] = command
+        for command in expired:
+            self.finish(command, False, "too old to replay")
+
+    def disconnected(self):
+        # results of commands sent on the lost connection will not come
+        with self.lock:
+            self.online = False
+            for command in self.in_flight.values():
+                if self.latest.get(command.key) is command:
+                    self.waiting[command.key] = command
+            self.in_flight.clear()
+
+    def latency_stats(self):
+        # round trip of acknowledged commands in milliseconds, for monitoring
+        with self.lock:
+            last = self.round_trips[-1] if self.round_trips else None
+            samples = sorted(self.round_trips)
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": len(samples),
+            "last_ms": round(last * 1000, 1),
+            "median_ms": round(samples[len(samples) // 2] * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1),
+        }
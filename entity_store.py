@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+
+
+# Kompaktowy magazyn stanow encji. Zamiast pelnych slownikow z HA (atrybuty, context, czasy)
+# trzymane sa tylko pola rysowane przez widgety i wykres, tylko dla skonfigurowanych encji.
+# Rekord nie jest zmieniany po przekazaniu do GUI: kazda zmiana tworzy kopie (watek websocket).
+
+# atrybut HA -> pole EntityState
+ATTRIBUTE_FIELDS = {
+    "brightness": "brightness",
+    "color_temp": "color_temp",
+    "hs_color": "hs_color",
+    "current_position": "position",
+    "percentage": "percentage",
+    "options": "options",
+    "min": "min",
+    "max": "max",
+    "step": "step",
+    "device_class": "device_class",
+}
+
+
+def compact_value(value):
+    # lists become tuples, repeated strings ("on", "off", device classes) are shared
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+class EntityState:
+    __slots__ = ("entity_id", "state") + tuple(ATTRIBUTE_FIELDS.values()) + ("full",)
+
+    def __init__(self, entity_id, state=None):
+        self.entity_id = entity_id
+        self.state = state
+        for field in ATTRIBUTE_FIELDS.values():
+            setattr(self, field, None)
+        # full HA state dict, only in the debug mode (state_store = full)
+        self.full = None
+
+    def same_as(self, other):
+        # full is ignored, only what the widgets draw matters
+        return other is not None and all(getattr(self, field) == getattr(other, field)
+                                         for field in EntityState.__slots__ if field != "full")
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in EntityState.__slots__
+                if field != "full" and getattr(self, field) is not None}
+
+    @staticmethod
+    def from_dict(data):
+        record = EntityState(sys.intern(data["entity_id"]), compact_value(data.get("state")))
+        for field in ATTRIBUTE_FIELDS.values():
+            setattr(record, field, compact_value(data.get(field)))
+        return record
+
+    def copy(self):
+        record = EntityState.__new__(EntityState)
+        for field in EntityState.__slots__:
+            setattr(record, field, getattr(self, field))
+        return record
+
+    def set_attributes(self, attributes):
+        for key, field in ATTRIBUTE_FIELDS.items():
+            setattr(self, field, compact_value(attributes.get(key)))
+
+    def update_attributes(self, added, removed):
+        for key, value in added.items():
+            field = ATTRIBUTE_FIELDS.get(key)
+            if field is not None:
+                setattr(self, field, compact_value(value))
+        for key in removed:
+            field = ATTRIBUTE_FIELDS.get(key)
+            if field is not None:
+                setattr(self, field, None)
+
+
+class EntityStateStore:
+    def __init__(self, entity_ids=None, full=False):
+        # entity_ids = entities kept in the store, None = all of them
+        self.entity_ids = entity_ids
+        self.full = full
+        self.states = {}
+        # bumped on every stored change, the snapshot is written only when it moved
+        self.version = 0
+
+    def get(self, entity_id, default=None):
+        return self.states.get(entity_id, default)
+
+    def __contains__(self, entity_id):
+        return entity_id in self.states
+
+    def __len__(self):
+        return len(self.states)
+
+    def wanted(self, entity_id):
+        return self.entity_ids is None or entity_id in self.entity_ids
+
+    def store(self, entity_id, record):
+        # returns None when nothing visible changed (resync after reconnect, untracked attributes)
+        old = self.states.get(entity_id)
+        self.states[entity_id] = record
+        if record.same_as(old):
+            return None
+        self.version += 1
+        return record
+
+    def set_state(self, entity_id, state_obj):
+        # full state object from state_changed / get_states, None = entity removed
+        if not self.wanted(entity_id):
+            return None
+        if state_obj is None:
+            return self.remove(entity_id)
+
+        record = EntityState(sys.intern(entity_id), compact_value(state_obj.get("state")))
+        record.set_attributes(state_obj.get("attributes", {}))
+        if self.full:
+            record.full = state_obj
+        return self.store(entity_id, record)
+
+    def add(self, entity_id, compressed):
+        # "a" entry of subscribe_entities: s = state, a = attributes
+        return self.set_state(entity_id, {
+            "entity_id": entity_id,
+            "state": compressed.get("s"),
+            "attributes": compressed.get("a", {}),
+        })
+
+    def change(self, entity_id, diff):
+        # "c" entry of subscribe_entities: "+" = new state / changed attributes, "-" = removed attributes
+        if not self.wanted(entity_id):
+            return None
+        old = self.states.get(entity_id)
+        record = old.copy() if old is not None else EntityState(sys.intern(entity_id))
+
+        added = diff.get("+", {})
+        removed = diff.get("-", {}).get("a", [])
+        if "s" in added:
+            record.state = compact_value(added["s"])
+        record.update_attributes(added.get("a", {}), removed)
+
+        if self.full:
+            full = dict(record.full or {"entity_id": entity_id})
+            attributes = dict(full.get("attributes", {}))
+            attributes.update(added.get("a", {}))
+            for key in removed:
+                attributes.pop(key, None)
+            full["state"] = record.state
+            full["attributes"] = attributes
+            record.full = full
+
+        return self.store(entity_id, record)
+
+    def remove(self, entity_id):
+        if not self.wanted(entity_id):
+            return None
+        record = EntityState(sys.intern(entity_id), "unavailable")
+        return self.store(entity_id, record)
+
+    def save(self, path):
+        # snapshot of the last known states, written to a temporary file and swapped in one step
+        version = self.version
+        data = [record.to_dict() for record in list(self.states.values())]
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        return version
+
+    def load(self, path):
+        # records of the snapshot that are still configured, the store is filled with them
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"state snapshot error: {e}")
+            return []
+
+        records = []
+        for item in data:
+            if not isinstance(item, dict) or not self.wanted(item.get("entity_id")):
+                continue
+            record = EntityState.from_dict(item)
+            self.states[record.entity_id] = record
+            records.append(record)
+        return records
@@ -0,0 +1,170 @@
+# Male obiekty aktualizujace widgety. Rejestr eid -> [updater, ...] jest budowany
+# raz w setup_widgets, wiec update_entity_state nie sprawdza juz prefiksow entity_id.
+# Kazdy updater pamieta ostatnio narysowana wartosc i nie dotyka widgetu, jesli sie nie zmienila.
+# state_obj = EntityState z entity_store.
+
+UNSET = object()
+
+
+class WidgetUpdater:
+    __slots__ = ("widget", "kind", "rendered")
+
+    def __init__(self, widget, kind):
+        self.widget = widget
+        self.kind = kind
+        self.rendered = UNSET
+
+    def update(self, state_obj):
+        raise NotImplementedError
+
+    def invalidate(self):
+        # widget was changed by the user, next state has to be drawn again
+        self.rendered = UNSET
+
+    def set_text(self, text):
+        if text == self.rendered:
+            return
+        self.rendered = text
+        self.widget.setText(text)
+
+
+class SliderUpdater(WidgetUpdater):
+    __slots__ = ()
+
+    def set_slider(self, value):
+        if value == self.rendered:
+            return
+        self.rendered = value
+        self.widget.blockSignals(True)
+        self.widget.setValue(value)
+        self.widget.blockSignals(False)
+
+
+class BrightnessUpdater(SliderUpdater):
+    __slots__ = ()
+
+    def update(self, state_obj):
+        if state_obj.state == "off":
+            brightness = 0
+        else:
+            brightness = int(state_obj.brightness or 0)
+        self.set_slider(brightness)
+
+
+class ColorTempUpdater(SliderUpdater):
+    __slots__ = ()
+
+    def update(self, state_obj):
+        temp = state_obj.color_temp
+        if isinstance(temp, (int, float)):
+            self.set_slider(int(temp))
+
+
+class HueUpdater(SliderUpdater):
+    __slots__ = ()
+
+    def update(self, state_obj):
+        hs_color = state_obj.hs_color
+        if hs_color:
+            self.set_slider(int(hs_color[0]))
+
+
+class AttributeSliderUpdater(SliderUpdater):
+    # cover -> position, fan -> percentage (EntityState field)
+    __slots__ = ("attribute",)
+
+    def __init__(self, widget, kind, attribute):
+        super().__init__(widget, kind)
+        self.attribute = attribute
+
+    def update(self, state_obj):
+        self.set_slider(int(getattr(state_obj, self.attribute) or 0))
+
+
+class SwitchUpdater(WidgetUpdater):
+    __slots__ = ()
+
+    def update(self, state_obj):
+        self.set_text("Off" if state_obj.state == "on" else "On")
+
+
+class SensorTextUpdater(WidgetUpdater):
+    __slots__ = ("itype",)
+
+    def __init__(self, widget, kind, itype):
+        super().__init__(widget, kind)
+        self.itype = itype
+
+    def update(self, state_obj):
+        state = state_obj.state
+        if "doors" in self.itype or "window" in self.itype:
+            state = "Open" if state == "on" else "Closed"
+        if "Presence" in self.itype:
+            state = "Presence" if state == "on" else "No presence"
+        self.set_text(str(state))
+
+
+class NumberUpdater(WidgetUpdater):
+    __slots__ = ()
+
+    def update(self, state_obj):
+        state = state_obj.state
+        try:
+            self.set_text(f"{float(state):.0f}")
+        except (TypeError, ValueError):
+            self.set_text(str(state))
+
+
+class SelectUpdater(WidgetUpdater):
+    __slots__ = ("options",)
+
+    def __init__(self, widget, kind):
+        super().__init__(widget, kind)
+        # not reset by invalidate(): the user can pick another item, not change the list
+        self.options = None
+
+    def update(self, state_obj):
+        options = state_obj.options or ()
+        current = state_obj.state
+        if options == self.options and current == self.rendered:
+            return
+
+        self.widget.blockSignals(True)
+        if options != self.options:
+            # combo is rebuilt only when the list of options really changed
+            self.widget.clear()
+            self.widget.addItems(options)
+            self.options = options
+            self.rendered = UNSET
+        if current != self.rendered and current in options:
+            self.widget.setCurrentIndex(options.index(current))
+        self.rendered = current
+        self.widget.blockSignals(False)
+
+
+def create_updater(eid, kind, widget, itype=""):
+    # kind: "brightness", "temp", "hue" (light sliders), "label" (number) or "generic"
+    domain = eid.split(".", 1)[0]
+
+    if domain == "light":
+        if kind == "brightness":
+            return BrightnessUpdater(widget, kind)
+        if kind == "temp":
+            return ColorTempUpdater(widget, kind)
+        if kind == "hue":
+            return HueUpdater(widget, kind)
+    elif kind == "label":
+        if domain == "number":
+            return NumberUpdater(widget, kind)
+    elif domain == "switch":
+        return SwitchUpdater(widget, kind)
+    elif domain == "cover":
+        return AttributeSliderUpdater(widget, kind, "position")
+    elif domain == "fan":
+        return AttributeSliderUpdater(widget, kind, "percentage")
+    elif domain in ("sensor", "binary_sensor"):
+        return SensorTextUpdater(widget, kind, itype)
+    elif domain == "select" and hasattr(widget, "addItems"):
+        return SelectUpdater(widget, kind)
+
+    return None
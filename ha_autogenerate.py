@@ -1,45 +1,68 @@
+# first import: startup times are measured from here
+from startup_timing import startup
 import sys
 import json
 import threading
 import websocket
 import os
 import os.path
-from PyQt5.QtCore import QTimer, Qt
+import random
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+from PyQt5.QtCore import QTimer, Qt, QObject, QEvent, pyqtSignal
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QLabel, QVBoxLayout,
-    QSlider, QPushButton, QHBoxLayout, QScrollArea, QGroupBox, QScroller, QStyleOptionSlider, QDesktopWidget, QComboBox
+    QSlider, QPushButton, QHBoxLayout, QScrollArea, QGroupBox, QScroller, QStyleOptionSlider, QDesktopWidget, QComboBox, QTabWidget
 )
 from PyQt5.QtGui import QMouseEvent
-from configparser import ConfigParser
-from sensor_graph import show_sensor_graph  
+from PyQt5.QtNetwork import QTcpSocket, QSslSocket, QAbstractSocket
+from app_config import config, config_path
 from PyQt5.QtGui import QColor
 from pyqt_advanced_slider import Slider
+from entity_updaters import create_updater
+from entity_store import EntityStateStore
+from command_queue import CommandQueue
+from throttle import ThrottleScheduler
+from latency import LatencyTracker
+import ha_codec
+import ws_frames
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel
         
 
-def get_config_path():
-    if getattr(sys, 'frozen', False):
-        base_path = os.path.dirname(sys.executable)
-    else:
-        base_path = os.path.dirname(os.path.abspath(__file__))
-
-    return os.path.join(base_path, "config.ini")
-
-# Wczytywanie pliku konfiguracyjnego
-config_path = get_config_path()
-config_object = ConfigParser()
-config_object.read(config_path)
-
-if "ha" not in config_object:
-    print("error config.ini!")
-    sys.exit(1)
-
-config = config_object["ha"]
-
-
 HA_TOKEN = config["ha_token"]
 HA_WS_URL = config["ha_ip_ws"]
 screen_settings = config["screen"]
+# "entities" = subscribe_entities only for entities from entities_list.json, "events" = all state_changed events
+subscribe_mode = config.get("subscribe_mode", "entities")
+# how often queued state updates are applied to widgets (one batch per tick)
+update_interval_ms = config.getint("update_interval_ms", 40)
+# "live" = open chart is updated from the websocket, "poll" = REST refresh every 60 s
+chart_mode = config.get("chart_mode", "live")
+# "list" = all zones in one scrolled page, "tabs" = one tab per zone, built when first shown or in idle time
+zone_layout = config.get("zone_layout", "list")
+# "compact" = only configured entities and rendered fields, "full" = whole HA state of every entity (debugging)
+state_store = config.get("state_store", "compact")
+# last known states of configured entities, shown at boot before HA answers (empty = disabled)
+state_snapshot = config.get("state_snapshot", "state_snapshot.json")
+# reconnect delay doubles from RECONNECT_BASE_S up to reconnect_max_s
+reconnect_max_s = config.getfloat("reconnect_max_s", 60)
+RECONNECT_BASE_S = 1
+# sliders send at most one command per this interval while dragged (first and last value always)
+slider_rate_ms = config.getint("slider_rate_ms", 300)
+# latency measurement: on-screen table and/or a JSON file rewritten every latency_dump_s seconds
+latency_overlay = config.getboolean("latency_overlay", False)
+latency_dump = config.get("latency_dump", "")
+latency_dump_s = config.getint("latency_dump_s", 60)
+# None = measurement disabled, every measuring point only checks this
+latency = LatencyTracker() if latency_overlay or latency_dump else None
+# "thread" = websocket-client in its own thread, "qt" = QTcpSocket on the Qt event loop (no threads)
+ws_client = config.get("ws_client", "thread")
+# permessage-deflate offered to HA, only the "qt" client can use it
+ws_compression = config.getboolean("ws_compression", True)
+HANDSHAKE_TIMEOUT_MS = 10000
+# optional file, every start appends one JSON line with the startup times
+startup.log_path = config.get("startup_log", "")
 
 
 
@@ -77,19 +100,85 @@ def load_stylesheet(path):
         return file.read()
         
         
+class StateUpdateQueue(QObject):
+    # put() is called from the websocket thread, flush() always runs in the GUI thread
+    wakeup = pyqtSignal()
+
+    def __init__(self, apply_update, interval=40, parent=None):
+        super().__init__(parent)
+        self.apply_update = apply_update
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.scheduled = False
+
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.setInterval(interval)
+        self.frame_timer.timeout.connect(self.flush)
+        self.wakeup.connect(self.schedule, Qt.QueuedConnection)
+
+    def put(self, eid, state):
+        # last write wins, a burst for one entity ends up as a single update
+        with self.lock:
+            self.pending[eid] = state
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.wakeup.emit()
+
+    def schedule(self):
+        if not self.frame_timer.isActive():
+            self.frame_timer.start()
+
+    def flush(self):
+        with self.lock:
+            batch = self.pending
+            self.pending = {}
+            self.scheduled = False
+
+        for eid, state in batch.items():
+            # flush is a Qt slot, an exception escaping it would abort PyQt5; one bad state skips only its entity
+            try:
+                self.apply_update(eid, state)
+            except Exception as e:
+                print(f"state update error {eid}: {e}")
+
+
 class HAWebSocketClient:
-    def __init__(self, on_state_update, on_disconnected=None):
+    def __init__(self, on_state_update, on_disconnected=None, entity_ids=None, entity_states=None, on_connected=None):
         self.ws = None
         self.authenticated = False
         self.connected = False
+        # disconnected -> connecting -> connected -> authenticated, one thread per connection at most
+        self.connection_state = "disconnected"
+        self.state_lock = threading.Lock()
+        self.closing = False
         self.msg_id = 1
-        self.entity_states = {}
+        # EntityStateStore, on_state_update gets its EntityState records
+        self.entity_states = entity_states if entity_states is not None else EntityStateStore()
         self.on_state_update = on_state_update
         self.on_disconnected = on_disconnected
+        self.on_connected = on_connected
+        # entity_ids set -> filtered subscribe_entities mode, None -> whole state_changed stream
+        self.entity_ids = set(entity_ids) if entity_ids else None
+        self.subscription_id = None
+        # id -> callback(msg) for requests that wait for their own result
+        self.pending_requests = {}
+        # call_service commands: result tracking, coalescing, replay after reconnect
+        self.commands = CommandQueue(self.send, self.next_id)
 
 
     def connect(self):
-        def run():
+        # False = a connection is already running (or the client is closed)
+        with self.state_lock:
+            if self.connection_state != "disconnected" or self.closing:
+                return False
+            self.connection_state = "connecting"
+        threading.Thread(target=self.run, daemon=True).start()
+        return True
+
+    def run(self):
+        try:
             self.ws = websocket.WebSocketApp(
                 HA_WS_URL,
                 on_open=self.on_open,
@@ -98,14 +187,47 @@ class HAWebSocketClient:
                 on_error=self.on_error
             )
             self.ws.run_forever()
-        threading.Thread(target=run, daemon=True).start()
+        finally:
+            # run_forever returns once per connection
+            self.connection_lost()
 
-    def send(self, payload):
-        if self.connected:
+    def connection_lost(self):
+        # called exactly once per connection, so is on_disconnected
+        self.connected = False
+        self.authenticated = False
+        # answers to requests sent on this connection will not come anymore, their callbacks get an error now
+        pending, self.pending_requests = self.pending_requests, {}
+        for msg_id, callback in pending.items():
             try:
-                self.ws.send(json.dumps(payload))
+                callback({"id": msg_id, "type": "result", "success": False,
+                          "error": {"code": "disconnected", "message": "connection lost"}})
             except Exception as e:
-                print(f"blad wysylania: {e}")
+                print(f"request callback error: {e}")
+        self.commands.disconnected()
+        with self.state_lock:
+            self.connection_state = "disconnected"
+        if self.on_disconnected and not self.closing:
+            self.on_disconnected()
+
+    def close(self):
+        self.closing = True
+        if self.ws is not None:
+            self.ws.close()
+
+    def send(self, payload):
+        # False = not sent (no connection or send error)
+        if not self.connected:
+            print(f"not connected, {payload.get('type')} not sent")
+            return False
+        try:
+            self.send_text(ha_codec.dumps(payload))
+        except Exception as e:
+            print(f"blad wysylania: {e}")
+            return False
+        return True
+
+    def send_text(self, text):
+        self.ws.send(text)
 
     def next_id(self):
         self.msg_id += 1
@@ -113,28 +235,56 @@ class HAWebSocketClient:
 
     def on_open(self, ws):
         self.connected = True
+        self.connection_state = "connected"
         print("polaczono z HA")
         self.send({"type": "auth", "access_token": HA_TOKEN})
 
     def on_message(self, ws, message):
+        if latency is not None:
+            received = time.monotonic()
+        if self.entity_ids is None:
+            # subscribe_events: most events are about entities without a widget, they are dropped undecoded
+            entity_id = ha_codec.state_changed_entity(message)
+            if entity_id is not None and not self.entity_states.wanted(entity_id):
+                return
         try:
-            msg = json.loads(message)
-        except json.JSONDecodeError:
+            msg = ha_codec.loads(message)
+        except ha_codec.DecodeError:
             print("bledny JSON:", message)
             return
+        if latency is not None:
+            self.receive_times = (received, time.monotonic())
 
         if msg["type"] == "auth_ok":
             self.authenticated = True
-            self.subscribe_events()
-            self.get_initial_states()
+            self.connection_state = "authenticated"
+            if self.on_connected:
+                self.on_connected()
+            self.commands.connected()
+            # after a reconnect everything comes again, the store passes on only what changed
+            if self.entity_ids:
+                self.subscribe_entities()
+            else:
+                self.subscribe_events()
+                self.get_initial_states()
+
+        elif msg["type"] == "event" and msg.get("id") == self.subscription_id and self.entity_ids:
+            self.handle_entities_event(msg["event"])
 
         elif msg["type"] == "event":
             entity_id = msg["event"]["data"]["entity_id"]
-            new_state = msg["event"]["data"]["new_state"]
-            self.entity_states[entity_id] = new_state
-            self.on_state_update(entity_id, new_state)
+            self.store_state(entity_id, self.entity_states.set_state(entity_id, msg["event"]["data"]["new_state"]),
+                             msg["event"].get("time_fired"))
 
         elif msg["type"] == "result":
+            if self.commands.handle_result(msg):
+                return
+
+            callback = self.pending_requests.pop(msg.get("id"), None)
+            if callback is not None:
+                callback(msg)
+                return
+
             if not msg.get("success"):
                 print(f"answer error: {msg.get('error')}")
                 return
@@ -145,27 +295,47 @@ class HAWebSocketClient:
 
             if isinstance(result, dict) and "entity_id" in result:
                 eid = result["entity_id"]
-                self.entity_states[eid] = result
-                self.on_state_update(eid, result)
+                self.store_state(eid, self.entity_states.set_state(eid, result))
 
             elif isinstance(result, list):
                 for state in result:
                     eid = state.get("entity_id")
                     if eid:
-                        self.entity_states[eid] = state
-                        self.on_state_update(eid, state)
+                        self.store_state(eid, self.entity_states.set_state(eid, state))
+
+    def store_state(self, eid, record, event_time=None):
+        startup.mark("first_state")
+        # None = entity not kept in the store (not configured) or nothing visible changed
+        if record is None:
+            return
+        if latency is not None:
+            # event_time: epoch seconds (subscribe_entities "lu") or ISO string (time_fired)
+            if isinstance(event_time, str):
+                event_time = datetime.fromisoformat(event_time.replace("Z", "+00:00")).timestamp()
+            latency.received(eid, *self.receive_times, event_time)
+        self.on_state_update(eid, record)
+
+    def handle_entities_event(self, event):
+        # skrocony format subscribe_entities: a = add (pelny stan), c = change (diff), r = remove
+        for eid, compressed in event.get("a", {}).items():
+            self.store_state(eid, self.entity_states.add(eid, compressed))
+
+        for eid, diff in event.get("c", {}).items():
+            # HA sends "lc" when the state changed and "lu" when only attributes did
+            added = diff.get("+", {})
+            self.store_state(eid, self.entity_states.change(eid, diff), added.get("lu", added.get("lc")))
+
+        for eid in event.get("r", []):
+            self.store_state(eid, self.entity_states.remove(eid))
 
     def on_close(self, ws, *args):
         self.connected = False
         print("websocket closed")
-        if self.on_disconnected:
-            self.on_disconnected()
 
     def on_error(self, ws, error):
-        self.connected = False
+        # also called for exceptions in our own callbacks while the socket stays open,
+        # a real disconnect ends run_forever and connection_lost() resets the flags
         print(f"error websocket: {error}")
-        if self.on_disconnected:
-            self.on_disconnected()
 
     def subscribe_events(self):
         self.send({
@@ -174,26 +344,175 @@ class HAWebSocketClient:
             "event_type": "state_changed"
         })
 
-    def get_initial_states(self):
+    def subscribe_entities(self):
+        # initial states come back as the first "a" event, no get_states needed
+        self.subscription_id = self.next_id()
         self.send({
-            "id": self.next_id(),
-            "type": "get_states"
+            "id": self.subscription_id,
+            "type": "subscribe_entities",
+            "entity_ids": sorted(self.entity_ids)
         })
 
-    def call_service(self, domain, service, entity_id, data=None):
-        if data is None:
-            data = {}
-        data["entity_id"] = entity_id
+    def get_initial_states(self):
         self.send({
             "id": self.next_id(),
-            "type": "call_service",
-            "domain": domain,
-            "service": service,
-            "service_data": data
+            "type": "get_states"
         })
 
+    def send_request(self, payload, callback):
+        # callback gets the whole result message and is called in the websocket thread (GUI thread with ws_client = qt)
+        if not self.connected or not self.authenticated:
+            return False
+        payload["id"] = self.next_id()
+        self.pending_requests[payload["id"]] = callback
+        if not self.send(payload):
+            # not sent, the caller falls back at once instead of waiting for an answer
+            self.pending_requests.pop(payload["id"], None)
+            return False
+        return True
+
+    def call_service(self, domain, service, entity_id, data=None, key=None, on_done=None):
+        # key = what the command sets, e.g. (entity_id, "brightness"); a newer command with the same key wins
+        return self.commands.submit(domain, service, entity_id, data, key, on_done)
+
+
+class QtWebSocketClient(HAWebSocketClient):
+    # ten sam klient, ale na petli zdarzen Qt: QTcpSocket (QSslSocket dla wss) i ramki z ws_frames,
+    # bez watkow, wszystkie callbacki w watku GUI; permessage-deflate gdy HA sie zgodzi
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket = None
+        self.frames = None
+        self.deflate = None
+        self.handshake_key = None
+        self.handshake_data = b""
+        self.handshake_timer = QTimer()
+        self.handshake_timer.setSingleShot(True)
+        self.handshake_timer.timeout.connect(self.handshake_timeout)
+
+    def connect(self):
+        # False = a connection is already running (or the client is closed)
+        if self.connection_state != "disconnected" or self.closing:
+            return False
+        self.connection_state = "connecting"
+
+        url = urlsplit(HA_WS_URL)
+        secure = url.scheme == "wss"
+        socket = QSslSocket() if secure else QTcpSocket()
+        # every signal carries its socket, late signals of an old connection are ignored
+        socket.readyRead.connect(lambda: self.socket_ready_read(socket))
+        socket.disconnected.connect(lambda: self.socket_closed(socket))
+        # errorOccurred is new in Qt 5.15, older versions only have the overloaded error signal
+        error_signal = getattr(socket, "errorOccurred", None) or socket.error[QAbstractSocket.SocketError]
+        error_signal.connect(lambda error: self.socket_error(socket))
+        (socket.encrypted if secure else socket.connected).connect(lambda: self.socket_connected(socket))
+        self.socket = socket
+        self.frames = None
+        self.deflate = None
+        self.handshake_data = b""
+        self.handshake_timer.start(HANDSHAKE_TIMEOUT_MS)
+
+        port = url.port or (443 if secure else 80)
+        if secure:
+            socket.connectToHostEncrypted(url.hostname, port)
+        else:
+            socket.connectToHost(url.hostname, port)
+        return True
+
+    def socket_connected(self, socket):
+        url = urlsplit(HA_WS_URL)
+        self.handshake_key = ws_frames.new_key()
+        extensions = {"Sec-WebSocket-Extensions": ws_frames.DEFLATE_OFFER} if ws_compression else None
+        socket.write(ws_frames.client_handshake(url.netloc, url.path or "/", self.handshake_key, extensions))
+
+    def socket_ready_read(self, socket):
+        if socket is not self.socket:
+            return
+        data = bytes(socket.readAll())
+        try:
+            if self.frames is None:
+                data = self.finish_handshake(data)
+                if data is None:
+                    return
+            for opcode, payload in self.frames.feed(data):
+                if opcode == ws_frames.OP_TEXT:
+                    self.on_message(None, payload.decode())
+                elif opcode == ws_frames.OP_PING:
+                    socket.write(ws_frames.encode_frame(ws_frames.OP_PONG, payload, mask=True))
+                elif opcode == ws_frames.OP_CLOSE:
+                    socket.write(ws_frames.encode_close(mask=True))
+                    socket.disconnectFromHost()
+                    return
+                # the socket may be gone after a callback (close() from the GUI)
+                if socket is not self.socket:
+                    return
+        except Exception as e:
+            # an exception escaping a slot aborts the whole PyQt5 process: protocol and decompression errors,
+            # broken UTF-8 and errors in on_message end only this connection, the reconnect follows
+            self.on_error(None, e)
+            socket.abort()
+            self.socket_closed(socket)
+
+    def finish_handshake(self, data):
+        # bytes after the HTTP answer are already websocket frames, None = answer not complete yet
+        self.handshake_data += data
+        head, separator, rest = self.handshake_data.partition(b"\r\n\r\n")
+        if not separator:
+            return None
+        status_line, headers = ws_frames.parse_http_head(head)
+        ws_frames.check_server_handshake(status_line, headers, self.handshake_key)
+        self.handshake_timer.stop()
+        self.deflate = ws_frames.client_deflate(headers)
+        self.frames = ws_frames.FrameParser(deflate=self.deflate)
+        self.on_open(None)
+        return rest
+
+    def handshake_timeout(self):
+        if self.socket is not None and self.frames is None:
+            print("websocket handshake timeout")
+            socket = self.socket
+            socket.abort()
+            self.socket_closed(socket)
+
+    def socket_error(self, socket):
+        if socket is not self.socket:
+            return
+        self.on_error(None, socket.errorString())
+        # a refused or failed connection never emits disconnected
+        if socket.state() == QAbstractSocket.UnconnectedState:
+            self.socket_closed(socket)
+
+    def socket_closed(self, socket):
+        if socket is not self.socket:
+            return
+        self.socket = None
+        self.handshake_timer.stop()
+        socket.deleteLater()
+        self.on_close(None)
+        self.connection_lost()
+
+    def close(self):
+        self.closing = True
+        if self.socket is not None:
+            if self.connected:
+                self.socket.write(ws_frames.encode_close(mask=True))
+                self.socket.flush()
+            # closed at once: a disconnectFromHost() still pending at exit was finished by the socket
+            # destructor, with the disconnected signal arriving on an already deleted wrapper
+            self.socket.abort()
+
+    def send_text(self, text):
+        if self.socket.write(ws_frames.encode_message(ws_frames.OP_TEXT, text, True, self.deflate)) < 0:
+            raise OSError(self.socket.errorString())
+
 
 class HAControlUI(QMainWindow):
+    # emitted from the websocket thread, handled in the GUI thread
+    ha_connected = pyqtSignal()
+    ha_disconnected = pyqtSignal()
+    # entity_id, error of a command HA refused or did not answer
+    command_failed = pyqtSignal(str, str)
+
     def __init__(self):
         super().__init__()
         global screen_settings
@@ -215,37 +534,89 @@ class HAControlUI(QMainWindow):
 
         self.main_layout = QVBoxLayout(self.central_widget)
 
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        QScroller.grabGesture(self.scroll_area.viewport(), QScroller.LeftMouseButtonGesture)
-        self.main_layout.addWidget(self.scroll_area)
+        if zone_layout == "tabs":
+            # every tab has its own scroll area, see setup_zone_tabs
+            self.zone_tabs = QTabWidget()
+            self.main_layout.addWidget(self.zone_tabs)
+        else:
+            self.scroll_area = QScrollArea()
+            self.scroll_area.setWidgetResizable(True)
+            QScroller.grabGesture(self.scroll_area.viewport(), QScroller.LeftMouseButtonGesture)
+            self.main_layout.addWidget(self.scroll_area)
 
-        self.container = QWidget()
-        self.container_layout = QVBoxLayout(self.container)
-        self.container_layout.setAlignment(Qt.AlignTop)
+            self.container = QWidget()
+            self.container_layout = QVBoxLayout(self.container)
+            self.container_layout.setAlignment(Qt.AlignTop)
 
-        self.scroll_area.setWidget(self.container)
+            self.scroll_area.setWidget(self.container)
 
         self.entity_widgets = {}
         self.entity_groups = load_entity_groups_from_file()
 
-        self.entity_info_types = {}
+        self.entity_updaters = {}
+        self.watched_entities = set()
+        self.graph_window = None
+        # entities of zones that are not built yet: eid -> number of such zones, newest state waits in deferred_states
+        self.deferred_entities = {}
+        self.deferred_states = {}
 
+        self.setup_widgets()
+        startup.mark("widgets")
 
-        self.ha = HAWebSocketClient(
-            on_state_update=self.update_entity_state,
-            on_disconnected=self.handle_disconnected
-        )
-        self.ha.connect()
+        self.state_queue = StateUpdateQueue(self.apply_ha_state, update_interval_ms, self)
+        # eid -> EntityState shown after a command, before HA confirms it
+        self.optimistic_states = {}
+        # eid -> {field: Command}, optimistic fields are kept until that command's result or echo
+        self.optimistic_commands = {}
+        self.command_failed.connect(self.rollback_command)
 
-        self.setup_widgets()
+        entity_states = EntityStateStore(None if state_store == "full" else self.watched_entities,
+                                         full=state_store == "full")
+        self.load_snapshot(entity_states)
 
+        self.reconnect_attempt = 0
         self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setSingleShot(True)
         self.reconnect_timer.timeout.connect(self.try_reconnect)
+        self.ha_connected.connect(self.handle_connected)
+        self.ha_disconnected.connect(self.handle_disconnected)
+
+        client_class = QtWebSocketClient if ws_client == "qt" else HAWebSocketClient
+        self.ha = client_class(
+            on_state_update=self.state_queue.put,
+            on_disconnected=self.ha_disconnected.emit,
+            entity_ids=self.watched_entities if subscribe_mode == "entities" else None,
+            entity_states=entity_states,
+            on_connected=self.ha_connected.emit
+        )
+        self.ha.connect()
+
+        if latency_overlay:
+            self.latency_label = QLabel(self.central_widget)
+            self.latency_label.setAttribute(Qt.WA_TransparentForMouseEvents)
+            self.latency_label.setStyleSheet("background: rgba(0, 0, 0, 170); color: #9f9; font-family: monospace; font-size: 11px; padding: 4px;")
+            self.latency_timer = QTimer(self)
+            self.latency_timer.timeout.connect(self.update_latency_overlay)
+            self.latency_timer.start(1000)
+        if latency_dump:
+            self.latency_dump_timer = QTimer(self)
+            self.latency_dump_timer.timeout.connect(self.dump_latency)
+            self.latency_dump_timer.start(latency_dump_s * 1000)
+
+        self.command_timer = QTimer(self)
+        self.command_timer.timeout.connect(self.ha.commands.check_timeouts)
+        self.command_timer.start(1000)
 
+        if state_snapshot:
+            self.snapshot_timer = QTimer(self)
+            self.snapshot_timer.timeout.connect(self.save_snapshot)
+            self.snapshot_timer.start(30000)
+        self.first_paint_done = False
 
 
-        self.debounce_timers = {}     
+
+        # one scheduler for all sliders, keyed by (entity_id, attribute)
+        self.throttle = ThrottleScheduler(slider_rate_ms, self)
 
 
 
@@ -257,9 +628,104 @@ class HAControlUI(QMainWindow):
 
 
     def select_changed(self, eid, combo):
+        self.invalidate_render(eid, "generic")
         new_value = combo.currentText()
         print(f"Zmiana {eid} -> {new_value}")
-        self.ha.call_service("select", "select_option", eid, {"option": new_value})
+        self.send_command("select", "select_option", eid, {"option": new_value}, state=new_value)
+
+    def current_state(self, eid):
+        # what the panel shows: optimistic state of a command in progress or the state from HA
+        return self.optimistic_states.get(eid) or self.ha.entity_states.get(eid)
+
+    def send_command(self, domain, service, eid, data=None, **optimistic):
+        # optimistic = EntityState fields drawn at once (e.g. brightness=120), undone if the command fails
+        state_obj = self.current_state(eid)
+        if optimistic and state_obj is not None:
+            record = state_obj.copy()
+            for field, value in optimistic.items():
+                setattr(record, field, value)
+            self.optimistic_states[eid] = record
+            self.update_entity_state(eid, record)
+        key = (eid, ",".join(sorted(optimistic)) or service)
+        if latency is not None:
+            latency.command_sent(eid)
+        command = self.ha.call_service(domain, service, eid, data, key, self.command_done)
+        if optimistic and state_obj is not None:
+            commands = self.optimistic_commands.setdefault(eid, {})
+            for field in optimistic:
+                commands[field] = command
+
+    def command_done(self, command, success, error):
+        # websocket thread (result) or GUI thread (timeout)
+        if latency is not None and success:
+            latency.command_result(command.entity_id, command.sent_at)
+        if not success:
+            self.command_failed.emit(command.entity_id, str(error))
+
+    def rollback_command(self, eid, error):
+        print(f"command for {eid} failed: {error}")
+        self.optimistic_states.pop(eid, None)
+        self.optimistic_commands.pop(eid, None)
+        state_obj = self.ha.entity_states.get(eid)
+        if state_obj is None:
+            return
+        for updater in self.entity_updaters.get(eid, ()):
+            updater.invalidate()
+        self.update_entity_state(eid, state_obj)
+
+    def apply_ha_state(self, eid, state_obj):
+        # a state from HA replaces the optimistic one
+        if eid in self.optimistic_commands:
+            state_obj = self.keep_optimistic(eid, state_obj)
+        else:
+            self.optimistic_states.pop(eid, None)
+        if latency is None:
+            self.update_entity_state(eid, state_obj)
+            return
+        started = time.monotonic()
+        self.update_entity_state(eid, state_obj)
+        latency.applied(eid, started, time.monotonic())
+
+    def keep_optimistic(self, eid, state_obj):
+        # fields of a command still waiting for its result keep the optimistic value, otherwise the echo
+        # of an older command (sent earlier in the same drag) would move the slider back under the finger
+        optimistic = self.optimistic_states[eid]
+        held = {}
+        for field, command in self.optimistic_commands[eid].items():
+            value = getattr(optimistic, field)
+            # the echo of the newest value ends the wait as well as the result
+            if getattr(state_obj, field) != value and self.ha.commands.pending(command):
+                held[field] = command
+        if not held:
+            del self.optimistic_commands[eid]
+            self.optimistic_states.pop(eid, None)
+            return state_obj
+
+        record = state_obj.copy()
+        for field in held:
+            setattr(record, field, getattr(optimistic, field))
+        self.optimistic_states[eid] = record
+        self.optimistic_commands[eid] = held
+        return record
+
+    def event(self, event):
+        # UpdateRequest = the window and its changed widgets are painted now
+        result = super().event(event)
+        if latency is not None and event.type() == QEvent.UpdateRequest:
+            latency.painted()
+        return result
+
+    def update_latency_overlay(self):
+        self.latency_label.setText(latency.overlay_text())
+        self.latency_label.adjustSize()
+        self.latency_label.move(self.central_widget.width() - self.latency_label.width() - 10, 10)
+        self.latency_label.raise_()
+
+    def dump_latency(self):
+        try:
+            latency.dump(os.path.join(os.path.dirname(config_path), latency_dump))
+        except OSError as e:
+            print(f"latency dump error: {e}")
     
     def create_slider(self, min_val, max_val, eid, slot, height=40, radius=4):
         slider = Slider(self)
@@ -289,14 +755,14 @@ class HAControlUI(QMainWindow):
         slider_temp = self.create_slider(200, 400, eid, self.slider_released_temp, radius=3)
 
 
-        current_value = self.ha.entity_states.get(eid, {}).get("attributes", {}).get("color_temp")
+        state_obj = self.ha.entity_states.get(eid)
+        current_value = state_obj.color_temp if state_obj else None
         if current_value == None:
            current_value = 300
         slider_temp.setValue(int(current_value))
 
 
-        self.entity_info_types[(eid, "temp")] = itype
-        self.entity_widgets[(eid, "temp")] = slider_temp
+        self.register_widget(eid, "temp", slider_temp, itype)
 
         label_name = QLabel(f"{name} Temperature")
         vbox_layout.addWidget(label_name)
@@ -341,17 +807,17 @@ class HAControlUI(QMainWindow):
 
 
 
-        current_value = self.ha.entity_states.get(eid, {}).get("attributes", {}).get("hs_color", 200)
-        current_value = current_value[0]
-        slider_temp.setValue(int(current_value))
+        state_obj = self.ha.entity_states.get(eid)
+        hs_color = state_obj.hs_color if state_obj else None
+        current_value = hs_color[0] if hs_color else 200
+        slider_hue.setValue(int(current_value))
 
 
-        self.entity_info_types[(eid, "temp")] = itype
-        self.entity_widgets[(eid, "temp")] = slider_temp
+        self.register_widget(eid, "hue", slider_hue, itype)
 
         label_ = QLabel(f"{name} Hue")
         vbox_layout.addWidget(label_)
-        vbox_layout.addWidget(slider_temp)
+        vbox_layout.addWidget(slider_hue)
         
         label_vis = QLabel()
         label_vis.setFixedHeight(30)
@@ -386,204 +852,254 @@ class HAControlUI(QMainWindow):
      
         
     def setup_widgets(self):
-        for group_name, entities in self.entity_groups.items():
-            group_box = QGroupBox(group_name)
+        for entities in self.entity_groups.values():
+            self.watched_entities.update(entity["entity_id"] for entity in entities)
 
-            group_layout = QVBoxLayout()
-            group_box.setLayout(group_layout)
+        if zone_layout == "tabs":
+            self.setup_zone_tabs()
+            return
+        for group_name, entities in self.entity_groups.items():
+            self.container_layout.addWidget(self.build_zone(group_name, entities))
 
+    def setup_zone_tabs(self):
+        # tab index -> (group_name, entities) of zones without widgets yet
+        self.unbuilt_zones = {}
+        for group_name, entities in self.entity_groups.items():
+            page = QScrollArea()
+            page.setWidgetResizable(True)
+            QScroller.grabGesture(page.viewport(), QScroller.LeftMouseButtonGesture)
+            index = self.zone_tabs.addTab(page, group_name)
+            self.unbuilt_zones[index] = (group_name, entities)
             for entity in entities:
                 eid = entity["entity_id"]
-                etype = entity["widget_type"]
-                itype = entity["info_type"]
-                name = entity["name"]
-                
+                self.deferred_entities[eid] = self.deferred_entities.get(eid, 0) + 1
+
+        self.zone_tabs.currentChanged.connect(self.build_zone_tab)
+        self.build_zone_tab(self.zone_tabs.currentIndex())
 
-                container = QWidget()
-                hbox = QHBoxLayout()
-                container.setLayout(hbox)
+        # the rest is built one zone at a time when the event loop has nothing else to do
+        self.zone_build_timer = QTimer(self)
+        self.zone_build_timer.timeout.connect(self.build_next_zone)
+        self.zone_build_timer.start(50)
+
+    def build_next_zone(self):
+        if not self.unbuilt_zones:
+            self.zone_build_timer.stop()
+            return
+        self.build_zone_tab(min(self.unbuilt_zones))
+
+    def build_zone_tab(self, index):
+        zone = self.unbuilt_zones.pop(index, None)
+        if zone is None:
+            return
+        group_name, entities = zone
+
+        container = QWidget()
+        container_layout = QVBoxLayout(container)
+        container_layout.setAlignment(Qt.AlignTop)
+        container_layout.addWidget(self.build_zone(group_name, entities))
+        self.zone_tabs.widget(index).setWidget(container)
+
+        for entity in entities:
+            eid = entity["entity_id"]
+            self.deferred_entities[eid] -= 1
+            if self.deferred_entities[eid] == 0:
+                del self.deferred_entities[eid]
+                state_obj = self.deferred_states.pop(eid, None)
+            else:
+                state_obj = self.deferred_states.get(eid)
+            if state_obj is not None:
+                self.update_entity_state(eid, state_obj)
+
+    def build_zone(self, group_name, entities):
+        group_box = QGroupBox(group_name)
+
+        group_layout = QVBoxLayout()
+        group_box.setLayout(group_layout)
+
+        for entity in entities:
+            eid = entity["entity_id"]
+            etype = entity["widget_type"]
+            itype = entity["info_type"]
+            name = entity["name"]
+
+
+            container = QWidget()
+            hbox = QHBoxLayout()
+            container.setLayout(hbox)
+
+            
+            if itype == "light":
+                icon = f"󰌵"
+            elif itype == "temp":
+                icon = f"󰌵"
+            elif itype == "switch":
+                icon = f"󱨤"
+            elif itype == "temperature":
+                icon = f"󰔄"
+            elif itype == "humadity":
+                icon = f"󰖎"
+            elif itype == "window":
+                icon = f"󱇛"
+            elif itype == "doors":
+                icon = f"󰠚"
+            elif itype == "cover":
+                icon = f"󱡇"
+            elif itype == "presence":
+                icon = f"󰙍"
+            elif itype == "fan":
+                icon = f"󰫕"
+            elif itype == "audio":
+                icon = f"󰓃"
+            elif itype == "list":
+                icon = f"󱭼"                    
+            else:
+                icon = f"󰞱"
+
+
+            label = QLabel(icon)
+            label.setObjectName("ico")
+            label.setFixedWidth(30)
+            label.setFixedHeight(30)
+            label.setAlignment(Qt.AlignHCenter)
+            hbox.addWidget(label)
+            
+            if itype == "temp":
+               name = f"{name} "
+               label_ = QLabel(name)
+               label_.setFixedWidth(140)
+               hbox.addWidget(label_)                                 
+                            
+            else:
+               label_ = QLabel(name)
+               label_.setFixedWidth(140)
+               hbox.addWidget(label_)                                 
+            
+            
+            if etype == "light":
+
+
+                vbox = QWidget()
+                vbox_layout = QVBoxLayout(vbox)
+                hbox.addWidget(vbox)
+                vbox_layout.setContentsMargins(0, 0, 0, 0) 
+                vbox_layout.setSpacing(0)                    
+
+                
+                slider = self.create_slider(0, 255, eid, self.slider_released, radius=3)
+                vbox_layout.addWidget(slider)
+                
+                self.register_widget(eid, "brightness", slider, itype)
+                
+                Hbox = QWidget()
+                Hbox_layout = QHBoxLayout(Hbox)
+                Hbox_layout.setContentsMargins(0, 10, 0, 0)  # top, left, bottom, right
+                Hbox_layout.setSpacing(0)
+                vbox_layout.addWidget(Hbox)      
 
                 
-                if itype == "light":
-                    icon = f"󰌵"
-                elif itype == "temp":
-                    icon = f"󰌵"
-                elif itype == "switch":
-                    icon = f"󱨤"
-                elif itype == "temperature":
-                    icon = f"󰔄"
-                elif itype == "humadity":
-                    icon = f"󰖎"
-                elif itype == "window":
-                    icon = f"󱇛"
-                elif itype == "doors":
-                    icon = f"󰠚"
-                elif itype == "cover":
-                    icon = f"󱡇"
-                elif itype == "presence":
-                    icon = f"󰙍"
-                elif itype == "fan":
-                    icon = f"󰫕"
-                elif itype == "audio":
-                    icon = f"󰓃"
-                elif itype == "list":
-                    icon = f"󱭼"                    
-                else:
-                    icon = f"󰞱"
-
-
-                label = QLabel(icon)
-                label.setObjectName("ico")
-                label.setFixedWidth(30)
-                label.setFixedHeight(30)
-                label.setAlignment(Qt.AlignHCenter)
-                hbox.addWidget(label)
                 
                 if itype == "temp":
-                   name = f"{name} "
-                   label_ = QLabel(name)
-                   label_.setFixedWidth(140)
-                   hbox.addWidget(label_)                                 
-                                
-                else:
-                   label_ = QLabel(name)
-                   label_.setFixedWidth(140)
-                   hbox.addWidget(label_)                                 
+                   btn_hue = QPushButton("Temperature")
+                   btn_hue.setObjectName("switch_button")
+                   btn_hue.setFixedSize(120, 40)
+                   btn_hue.clicked.connect(lambda _, eid=eid, itype="temp", name=name: self.show_temp_popup(eid, itype, name))
+                   Hbox_layout.addWidget(btn_hue)
+
+                if itype == "temp_color":
+
+                   btn_hue = QPushButton("Temperature")
+                   btn_hue.setFixedSize(120, 40)
+                   btn_hue.setObjectName("switch_button")
+                   btn_hue.clicked.connect(lambda _, eid=eid, itype="temp", name=name: self.show_temp_popup(eid, itype, name))
+                   Hbox_layout.addWidget(btn_hue)
+                   btn_Hue = QPushButton("Hue")
+                   btn_Hue.setObjectName("switch_button")
+                   btn_Hue.setFixedSize(120, 40)
+                   btn_Hue.clicked.connect(lambda _, eid=eid, itype="temp_color", name=name: self.show_color_popup(eid, itype, name))
+                   Hbox_layout.addWidget(btn_Hue)
+
+                
                 
+            elif etype == "switch":
+                button = QPushButton("On")
+                button.setObjectName("switch_button")
+                button.clicked.connect(lambda _, eid=eid: self.toggle_switch(eid))
+                hbox.addWidget(button)
+                self.register_widget(eid, "generic", button, itype)
+
+            elif etype == "cover":
+                slider = self.create_slider(0, 100, eid, self.cover_slider_released)
+                hbox.addWidget(slider)
+                self.register_widget(eid, "generic", slider, itype)
+
+            elif etype == "fan":
+                slider = self.create_slider(0, 100, eid, self.fan_slider_released)
+                hbox.addWidget(slider)
+                self.register_widget(eid, "generic", slider, itype)
                 
-                if etype == "light":
-
-
-                    vbox = QWidget()
-                    vbox_layout = QVBoxLayout(vbox)
-                    hbox.addWidget(vbox)
-                    vbox_layout.setContentsMargins(0, 0, 0, 0) 
-                    vbox_layout.setSpacing(0)                    
-
-                    
-                    slider = self.create_slider(0, 255, eid, self.slider_released, radius=3)
-                    vbox_layout.addWidget(slider)
-                    
-                    self.entity_info_types[(eid, "brightness")] = itype
-                    self.entity_widgets[(eid, "brightness")] = slider
-                    
-                    Hbox = QWidget()
-                    Hbox_layout = QHBoxLayout(Hbox)
-                    Hbox_layout.setContentsMargins(0, 10, 0, 0)  # top, left, bottom, right
-                    Hbox_layout.setSpacing(0)
-                    vbox_layout.addWidget(Hbox)      
-
-                    
-                    
-                    if itype == "temp":
-                       btn_hue = QPushButton("Temperature")
-                       btn_hue.setObjectName("switch_button")
-                       btn_hue.setFixedSize(120, 40)
-                       btn_hue.clicked.connect(lambda _, eid=eid, itype="temp", name=name: self.show_temp_popup(eid, itype, name))
-                       Hbox_layout.addWidget(btn_hue)
-
-                    if itype == "temp_color":
-
-                       btn_hue = QPushButton("Temperature")
-                       btn_hue.setFixedSize(120, 40)
-                       btn_hue.setObjectName("switch_button")
-                       btn_hue.clicked.connect(lambda _, eid=eid, itype="temp", name=name: self.show_temp_popup(eid, itype, name))
-                       Hbox_layout.addWidget(btn_hue)
-                       btn_Hue = QPushButton("Hue")
-                       btn_Hue.setObjectName("switch_button")
-                       btn_Hue.setFixedSize(120, 40)
-                       btn_Hue.clicked.connect(lambda _, eid=eid, itype="temp_color", name=name: self.show_color_popup(eid, itype, name))
-                       Hbox_layout.addWidget(btn_Hue)
-
-                    
-                    
-                elif etype == "switch":
-                    button = QPushButton("On")
-                    button.setObjectName("switch_button")
-                    button.clicked.connect(lambda _, eid=eid: self.toggle_switch(eid))
-                    hbox.addWidget(button)
-                    self.entity_info_types[eid] = itype
-                    self.entity_widgets[eid] = button
-
-                elif etype == "cover":
-                    slider = self.create_slider(0, 100, eid, self.cover_slider_released)
-                    hbox.addWidget(slider)
-                    self.entity_info_types[eid] = itype
-                    self.entity_widgets[eid] = slider
-
-                elif etype == "fan":
-                    slider = self.create_slider(0, 100, eid, self.fan_slider_released)
-                    hbox.addWidget(slider)
-                    self.entity_info_types[eid] = itype
-                    self.entity_widgets[eid] = slider
-                    
-                elif etype == "number":
-                    value_layout = QHBoxLayout()
-                    value_widget = QWidget()
-                    value_widget.setLayout(value_layout)
-                    btn_minus = QPushButton("󱘹")
-                    btn_minus.setFixedSize(80, 40)
-                    btn_minus.setObjectName("switch_button")
-                    value_layout.addWidget(btn_minus)
-                    value_label = QLabel("...")
-                    value_label.setFixedWidth(60)
-                    value_label.setAlignment(Qt.AlignCenter)
-                    value_label.setObjectName("label")
-                    value_layout.addWidget(value_label)
-                    btn_plus = QPushButton("󰿶")
-                    btn_plus.setFixedSize(80, 40)
-                    btn_plus.setObjectName("switch_button")
-                    value_layout.addWidget(btn_plus)
-                    hbox.addWidget(value_widget)
-                    self.entity_widgets[(eid, "label")] = value_label
-                    self.entity_info_types[eid] = itype
-                    btn_minus.clicked.connect(lambda _, eid=eid: self.adjust_number_value(eid, -1))
-                    btn_plus.clicked.connect(lambda _, eid=eid: self.adjust_number_value(eid, 1))
+            elif etype == "number":
+                value_layout = QHBoxLayout()
+                value_widget = QWidget()
+                value_widget.setLayout(value_layout)
+                btn_minus = QPushButton("󱘹")
+                btn_minus.setFixedSize(80, 40)
+                btn_minus.setObjectName("switch_button")
+                value_layout.addWidget(btn_minus)
+                value_label = QLabel("...")
+                value_label.setFixedWidth(60)
+                value_label.setAlignment(Qt.AlignCenter)
+                value_label.setObjectName("label")
+                value_layout.addWidget(value_label)
+                btn_plus = QPushButton("󰿶")
+                btn_plus.setFixedSize(80, 40)
+                btn_plus.setObjectName("switch_button")
+                value_layout.addWidget(btn_plus)
+                hbox.addWidget(value_widget)
+                self.register_widget(eid, "label", value_label, itype)
+                btn_minus.clicked.connect(lambda _, eid=eid: self.adjust_number_value(eid, -1))
+                btn_plus.clicked.connect(lambda _, eid=eid: self.adjust_number_value(eid, 1))
     
-                    
-                elif etype == "sensor_chart":
-                    button = QPushButton("...")
-                    button.setObjectName("sensor_chart_button")
-                    button.clicked.connect(lambda _, eid=eid: self.toggle_sensor_chart(eid))
-                    hbox.addWidget(button)
-                    self.entity_info_types[eid] = itype
-                    self.entity_widgets[eid] = button
-
-                elif etype == "sensor" or etype == "binary_sensor":
-                    value_label = QLabel("...")
-                    value_label.setObjectName("label")
-                    hbox.addWidget(value_label)
-                    self.entity_info_types[eid] = itype
-                    self.entity_widgets[eid] = value_label
-
-                elif etype == "select":
-                    combo = QComboBox()
-                    combo.setFixedHeight(40)
-                    combo.setObjectName("select_combo")
-                    combo.entity_id = eid
-                    combo.currentIndexChanged.connect(lambda _, eid=eid, combo=combo: self.select_changed(eid, combo))
-                    hbox.addWidget(combo)
-
-                    self.entity_info_types[eid] = itype
-                    self.entity_widgets[eid] = combo
+                
+            elif etype == "sensor_chart":
+                button = QPushButton("...")
+                button.setObjectName("sensor_chart_button")
+                button.clicked.connect(lambda _, eid=eid: self.toggle_sensor_chart(eid))
+                hbox.addWidget(button)
+                self.register_widget(eid, "generic", button, itype)
+
+            elif etype == "sensor" or etype == "binary_sensor":
+                value_label = QLabel("...")
+                value_label.setObjectName("label")
+                hbox.addWidget(value_label)
+                self.register_widget(eid, "generic", value_label, itype)
+
+            elif etype == "select":
+                combo = QComboBox()
+                combo.setFixedHeight(40)
+                combo.setObjectName("select_combo")
+                combo.entity_id = eid
+                combo.currentIndexChanged.connect(lambda _, eid=eid, combo=combo: self.select_changed(eid, combo))
+                hbox.addWidget(combo)
+
+                self.register_widget(eid, "generic", combo, itype)
     
-                group_layout.addWidget(container)
+            group_layout.addWidget(container)
 
-            self.container_layout.addWidget(group_box)
+        return group_box
 
 
     def adjust_number_value(self, eid, direction):
-        state_obj = self.ha.entity_states.get(eid)
+        state_obj = self.current_state(eid)
         if not state_obj:
             print(f"no entity state {eid}")
             return
     
-        attrs = state_obj.get("attributes", {})
         try:
-            current = float(state_obj.get("state", 0))
-            step = float(attrs.get("step", 1))    
-            min_ = float(attrs.get("min", 0))
-            max_ = float(attrs.get("max", 100))
+            current = float(state_obj.state if state_obj.state is not None else 0)
+            step = float(state_obj.step if state_obj.step is not None else 1)
+            min_ = float(state_obj.min if state_obj.min is not None else 0)
+            max_ = float(state_obj.max if state_obj.max is not None else 100)
         except (ValueError, TypeError) as e:
             print(f"atrr error {eid}: {e}")
             return
@@ -591,221 +1107,174 @@ class HAControlUI(QMainWindow):
         new_value = current + direction * step
         new_value = max(min_, min(max_, new_value)) 
 
-        self.ha.call_service("number", "set_value", eid, {"value": new_value})
+        self.send_command("number", "set_value", eid, {"value": new_value}, state=str(new_value))
     
+    def register_widget(self, eid, kind, widget, itype=""):
+        key = eid if kind == "generic" else (eid, kind)
+        self.entity_widgets[key] = widget
+
+        updater = create_updater(eid, kind, widget, itype)
+        if updater is None:
+            return
+        # popup sliders are created again on every open, keep only the newest one
+        updaters = [u for u in self.entity_updaters.get(eid, []) if u.kind != kind]
+        updaters.append(updater)
+        self.entity_updaters[eid] = updaters
+        widget.destroyed.connect(lambda _=None, eid=eid, updater=updater: self.unregister_updater(eid, updater))
+
+    def unregister_updater(self, eid, updater):
+        updaters = [u for u in self.entity_updaters.get(eid, []) if u is not updater]
+        if updaters:
+            self.entity_updaters[eid] = updaters
+        else:
+            self.entity_updaters.pop(eid, None)
+
+    def invalidate_render(self, eid, kind):
+        for updater in self.entity_updaters.get(eid, ()):
+            if updater.kind == kind:
+                updater.invalidate()
+
     def update_entity_state(self, eid, state_obj):
-        # Jasność slider
-        brightness_widget = self.entity_widgets.get((eid, "brightness"))
-        temp_widget = self.entity_widgets.get((eid, "temp"))
-        hue_widget = self.entity_widgets.get((eid, "hue"))
-        generic_widget = self.entity_widgets.get(eid)  
-
-        itype = self.entity_info_types.get(eid, "")
-        state = state_obj.get("state")
-        attrs = state_obj.get("attributes", {})
-
-
-        if eid.startswith("light."):
-            if brightness_widget:
-                brightness = 0 if state == "off" else int(attrs.get("brightness", 0))
-                brightness_widget.blockSignals(True)
-                brightness_widget.setValue(brightness)
-                brightness_widget.blockSignals(False)
-
-            if temp_widget:
-                temp = attrs.get("color_temp")
-                print(temp)
-                if isinstance(temp, (int, float)):
-                    temp_widget.blockSignals(True)
-                    temp_widget.setValue(int(temp))
-                    temp_widget.blockSignals(False)
-
-            if hue_widget:
-                hue = attrs.get("hue")
-                if isinstance(temp, (int, float)):
-                    hue_widget.blockSignals(True)
-                    hue_widget.setValue(int(hue))
-                    hue_widget.blockSignals(False)
-                    
-        elif eid.startswith("switch."):
-            if generic_widget:
-                generic_widget.setText("Off" if state == "on" else "On")
-
-        elif eid.startswith("cover."):
-            if generic_widget:
-                position = int(attrs.get("current_position", 0))
-                generic_widget.blockSignals(True)
-                generic_widget.setValue(position)
-                generic_widget.blockSignals(False)
-
-        elif eid.startswith("fan."):
-            if generic_widget:
-                position = int(attrs.get("percentage", 0))
-                generic_widget.blockSignals(True)
-                generic_widget.setValue(position)
-                generic_widget.blockSignals(False)
-                
-        elif eid.startswith("sensor_chart."):
-            if generic_widget:
-                generic_widget.setText(str(state))
-
-        elif eid.startswith("sensor.") or eid.startswith("binary_sensor."):
-            if generic_widget:
-                if "doors" in itype or "window" in itype:
-                    state = "Open" if state == "on" else "Closed"
-                if "Presence" in itype:
-                    state = "Presence" if state == "on" else "No presence"
-                generic_widget.setText(str(state))
-
-        elif eid.startswith("number."):
-            label = self.entity_widgets.get((eid, "label"))
-            if label:
-                try:
-                    label.setText(f"{float(state):.0f}")
-                except:
-                    label.setText(state)
-
-
-        elif eid.startswith("select."):
-            if isinstance(generic_widget, QComboBox):
-                options = attrs.get("options", [])
-                current = state
-
-                generic_widget.blockSignals(True)
-                generic_widget.clear()
-                generic_widget.addItems(options)
-                if current in options:
-                    index = options.index(current)
-                    generic_widget.setCurrentIndex(index)
-                generic_widget.blockSignals(False)
+        if eid in self.deferred_entities:
+            self.deferred_states[eid] = state_obj
+        updaters = self.entity_updaters.get(eid)
+        if updaters is None:
+            return
+        for updater in updaters:
+            updater.update(state_obj)
+
+        if self.graph_window is not None and self.graph_window.sensor_id == eid:
+            self.graph_window.push_state(state_obj)
         
     def slider_released(self, value):
-        slider = self.sender()
-        eid = slider.entity_id
-        brightness = value
-        
-        if eid in self.debounce_timers:
-            self.debounce_timers[eid].stop()
-        
-        timer = QTimer(self)
-        timer.setSingleShot(True)
-        timer.timeout.connect(lambda eid=eid, brightness=brightness: self.send_slider_value(eid, brightness))
-        self.debounce_timers[eid] = timer
-        timer.start(300)  
+        eid = self.sender().entity_id
+        if latency is not None:
+            latency.user_input(eid)
+        self.throttle.submit((eid, "brightness"), self.send_slider_value, eid, value)
 
     def slider_released_temp(self, value):
-        slider = self.sender()
-        eid = slider.entity_id
-        temp = value
-        
-        if eid in self.debounce_timers:
-            self.debounce_timers[eid].stop()
-        
-        timer = QTimer(self)
-        timer.setSingleShot(True)
-        timer.timeout.connect(lambda eid=eid, temp=temp: self.send_slider_value_temp(eid, temp))
-        self.debounce_timers[eid] = timer
-        timer.start(300)  
+        eid = self.sender().entity_id
+        if latency is not None:
+            latency.user_input(eid)
+        self.throttle.submit((eid, "color_temp"), self.send_slider_value_temp, eid, value)
 
     def slider_released_hue(self, value):
-        slider = self.sender()
-        eid = slider.entity_id
-        hue = value
-        
-        if eid in self.debounce_timers:
-            self.debounce_timers[eid].stop()
-        
-        timer = QTimer(self)
-        timer.setSingleShot(True)
-        timer.timeout.connect(lambda eid=eid, hue=hue: self.send_slider_value_hue(eid, hue))
-        self.debounce_timers[eid] = timer
-        timer.start(300)  
+        eid = self.sender().entity_id
+        if latency is not None:
+            latency.user_input(eid)
+        self.throttle.submit((eid, "hs_color"), self.send_slider_value_hue, eid, value)
         
         
+    # the render cache is invalidated once per sent command (not per slider tick), so the slider
+    # is redrawn only with the value just sent, i.e. where the finger is
+
     def send_slider_value(self, eid, brightness):
+        self.invalidate_render(eid, "brightness")
         if brightness > 0:
-            self.ha.call_service("light", "turn_on", eid, {"brightness": brightness})
+            self.send_command("light", "turn_on", eid, {"brightness": brightness}, state="on", brightness=brightness)
         else:
-            self.ha.call_service("light", "turn_off", eid)
-        if eid in self.debounce_timers:
-          del self.debounce_timers[eid]
+            self.send_command("light", "turn_off", eid, state="off", brightness=0)
 
     def send_slider_value_temp(self, eid, temp):
-        self.ha.call_service("light", "turn_on", eid, {"color_temp": temp})
-        if eid in self.debounce_timers:
-          del self.debounce_timers[eid]
+        self.invalidate_render(eid, "temp")
+        self.send_command("light", "turn_on", eid, {"color_temp": temp}, color_temp=temp)
           
     def send_slider_value_hue(self, eid, hue):
-        self.ha.call_service("light", "turn_on", eid, {"hs_color": [hue, 100]})
-        if eid in self.debounce_timers:
-          del self.debounce_timers[eid]
+        self.invalidate_render(eid, "hue")
+        self.send_command("light", "turn_on", eid, {"hs_color": [hue, 100]}, hs_color=(hue, 100))
           
     def send_cover_slider_value(self, eid, position):
-        self.ha.call_service("cover", "set_cover_position", eid, {"position": position})
-        if eid in self.debounce_timers:
-          del self.debounce_timers[eid]
+        self.invalidate_render(eid, "generic")
+        self.send_command("cover", "set_cover_position", eid, {"position": position}, position=position)
           
     def send_fan_slider_value(self, eid, position):
+        self.invalidate_render(eid, "generic")
         print("fan")
-        self.ha.call_service("fan", "set_percentage", eid, {"percentage": position})
-        if eid in self.debounce_timers:
-          del self.debounce_timers[eid]
+        self.send_command("fan", "set_percentage", eid, {"percentage": position}, percentage=position)
           
     def cover_slider_released(self, value):
-        slider = self.sender()
-        eid = slider.entity_id
-        position = value
-        
-        if eid in self.debounce_timers:
-            self.debounce_timers[eid].stop()
-        
-        timer = QTimer(self)
-        timer.setSingleShot(True)
-        timer.timeout.connect(lambda eid=eid, position=position: self.send_cover_slider_value(eid, position))
-        self.debounce_timers[eid] = timer
-        timer.start(300)  
+        eid = self.sender().entity_id
+        if latency is not None:
+            latency.user_input(eid)
+        self.throttle.submit((eid, "position"), self.send_cover_slider_value, eid, value)
 
     def fan_slider_released(self, value):
-        slider = self.sender()
-        eid = slider.entity_id
-        position = value
-        
-        if eid in self.debounce_timers:
-            self.debounce_timers[eid].stop()
-        
-        timer = QTimer(self)
-        timer.setSingleShot(True)
-        timer.timeout.connect(lambda eid=eid, position=position: self.send_fan_slider_value(eid, position))
-        self.debounce_timers[eid] = timer
-        timer.start(300) 
+        eid = self.sender().entity_id
+        if latency is not None:
+            latency.user_input(eid)
+        self.throttle.submit((eid, "percentage"), self.send_fan_slider_value, eid, value)
         
         
         
     def toggle_switch(self, eid):
-        state = self.ha.entity_states.get(eid, {}).get("state")
+        state_obj = self.current_state(eid)
+        state = state_obj.state if state_obj else None
         service = "turn_off" if state == "on" else "turn_on"
-        self.ha.call_service("switch", service, eid)
+        self.send_command("switch", service, eid, state="off" if state == "on" else "on")
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            startup.mark("first_paint")
+            # chart stack (pyqtgraph, numpy, requests) is loaded only after the first frame
+            QTimer.singleShot(0, self.prewarm_chart)
+
+    def prewarm_chart(self):
+        from sensor_graph import prewarm_chart_window
+        self.graph_window = prewarm_chart_window(live=chart_mode == "live", state_lookup=self.ha.entity_states.get,
+                                                 ws_request=self.ha.send_request)
 
     def toggle_sensor_chart(self, eid):
-        if hasattr(self, "graph_window") and self.graph_window.isVisible():
-            print("already open")
-        else:
-            self.graph_window = show_sensor_graph(eid)
-            self.graph_window.show()
-            self.graph_window.raise_()
-            self.graph_window.activateWindow()
+        # one chart window for all sensors, an open chart switches to the new sensor
+        from sensor_graph import show_sensor_graph
+        self.graph_window = show_sensor_graph(eid, live=chart_mode == "live", state_lookup=self.ha.entity_states.get,
+                                              ws_request=self.ha.send_request)
+        self.graph_window.raise_()
+        self.graph_window.activateWindow()
+
+    def load_snapshot(self, entity_states):
+        # last known values are drawn at once, HA states replace them when they differ
+        self.snapshot_version = 0
+        if not state_snapshot:
+            return
+        for record in entity_states.load(os.path.join(os.path.dirname(config_path), state_snapshot)):
+            self.update_entity_state(record.entity_id, record)
+
+    def save_snapshot(self):
+        if not state_snapshot or self.ha.entity_states.version == self.snapshot_version:
+            return
+        try:
+            self.snapshot_version = self.ha.entity_states.save(os.path.join(os.path.dirname(config_path), state_snapshot))
+        except OSError as e:
+            print(f"state snapshot error: {e}")
+
+    def closeEvent(self, event):
+        print(f"command round trip: {self.ha.commands.latency_stats()}")
+        self.save_snapshot()
+        self.ha.close()
+        super().closeEvent(event)
+
+    def handle_connected(self):
+        self.reconnect_attempt = 0
+        self.reconnect_timer.stop()
 
     def handle_disconnected(self):
-        if not self.reconnect_timer.isActive():
-            print("another try after 10 seconds")
-            self.reconnect_timer.start(10000)
+        if self.reconnect_timer.isActive():
+            return
+        # 1, 2, 4 ... reconnect_max_s seconds, randomized so that several panels do not hit HA at once
+        delay = min(reconnect_max_s, RECONNECT_BASE_S * 2 ** min(self.reconnect_attempt, 16))
+        delay *= random.uniform(0.5, 1.0)
+        self.reconnect_attempt += 1
+        print(f"another try after {delay:.1f} seconds")
+        self.reconnect_timer.start(int(delay * 1000))
 
     def try_reconnect(self):
-        if not self.ha.connected:
-            print("reconnecting with HA")
-            self.ha.connect()
-        else:
-            self.reconnect_timer.stop()
+        print("reconnecting with HA")
+        self.ha.connect()
+
+
+startup.mark("imports")
 
 
 if __name__ == "__main__":
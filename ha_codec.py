@@ -0,0 +1,57 @@
+import re
+import json
+
+from app_config import config
+
+
+# Kodek JSON dla websocket i REST: orjson albo ujson gdy sa zainstalowane, inaczej json z biblioteki standardowej.
+# json_codec = auto (domyslnie), orjson, ujson albo json.
+
+def stdlib_codec():
+    return "json", json.loads, lambda obj: json.dumps(obj, separators=(",", ":"))
+
+
+def orjson_codec():
+    import orjson
+    # orjson.dumps returns bytes, websocket text frames and requests need str
+    return "orjson", orjson.loads, lambda obj: orjson.dumps(obj).decode()
+
+
+def ujson_codec():
+    import ujson
+    return "ujson", ujson.loads, ujson.dumps
+
+
+CODECS = {"orjson": orjson_codec, "ujson": ujson_codec, "json": stdlib_codec}
+
+
+def select_codec(name):
+    order = ["orjson", "ujson", "json"] if name == "auto" else [name, "json"]
+    for candidate in order:
+        factory = CODECS.get(candidate)
+        if factory is None:
+            print(f"unknown json_codec: {candidate}")
+            continue
+        try:
+            return factory()
+        except ImportError:
+            if name != "auto":
+                print(f"{candidate} is not installed, json instead")
+    return stdlib_codec()
+
+
+codec_name, loads, dumps = select_codec(config.get("json_codec", "auto"))
+
+# all decoders raise a ValueError subclass on bad input
+DecodeError = ValueError
+
+# entity_id of a state_changed event read from the raw text, the event keeps entity_id first in "data"
+STATE_CHANGED_ENTITY = re.compile(r'"data":\s*\{\s*"entity_id":\s*"([^"]+)"')
+
+
+def state_changed_entity(message, head=256):
+    # None = not a state_changed event or a different layout, such messages are always decoded
+    if '"state_changed"' not in message[:head]:
+        return None
+    match = STATE_CHANGED_ENTITY.search(message, 0, head)
+    return match.group(1) if match else None
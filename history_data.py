@@ -0,0 +1,120 @@
+import numpy as np
+
+
+# Parsowanie historii z HA do tablic numpy (bez Qt, uzywane przez sensor_graph i benchmarki).
+
+BINARY_STATES = {"on": 1, "off": 0, "open": 1, "closed": 0}
+# HA sends states in lower case, upper case variants only for safety
+BINARY_VALUES = {**BINARY_STATES, **{state.upper(): value for state, value in BINARY_STATES.items()}}
+
+
+def state_to_value(state, is_binary):
+    # None = stan, ktorego nie da sie narysowac (unavailable, unknown...)
+    if state is None:
+        return None
+    if is_binary:
+        return BINARY_STATES.get(state.lower())
+    try:
+        return float(state)
+    except ValueError:
+        return None
+
+
+def parse_timestamps(strings):
+    # HA always answers in UTC: "2024-01-01T10:00:00.123456+00:00", numpy parses the part before the offset
+    strings = np.array(strings)
+    if strings.dtype == np.dtype("U32") and (np.char.str_len(strings) == 32).all():
+        strings = strings.astype("U26")
+    else:
+        # mixed precision (no microseconds) or "Z" suffix
+        strings = np.char.replace(np.char.replace(strings, "+00:00", ""), "Z", "")
+    return strings.astype("datetime64[us]").astype(np.int64) / 1e6
+
+
+def parse_states(states, is_binary):
+    # float64 values, NaN for states that can not be drawn
+    if is_binary:
+        return np.fromiter((BINARY_VALUES.get(state, np.nan) for state in states), np.float64, len(states))
+
+    try:
+        # fast path, float() of every state in C without Python-level exception handling
+        return np.fromiter(map(float, states), np.float64, len(states))
+    except ValueError:
+        pass
+
+    return np.fromiter((np.nan if value is None else value
+                        for value in (state_to_value(state, False) for state in states)),
+                       np.float64, len(states))
+
+
+def parse_history(entries, is_binary):
+    # entries from /api/history/period with minimal_response: only the first one has all keys,
+    # every entry has "state" and "last_changed"
+    if not entries:
+        return np.empty(0), np.empty(0)
+
+    timestamps = parse_timestamps([entry["last_changed"] for entry in entries])
+    values = parse_states([entry["state"] for entry in entries], is_binary)
+
+    drawable = ~np.isnan(values)
+    return timestamps[drawable], values[drawable]
+
+
+def step_edges(x, y):
+    # for step plots only points where the value changes matter (plus the last one)
+    if len(x) < 3:
+        return x, y
+    keep = np.empty(len(y), dtype=bool)
+    keep[0] = True
+    keep[1:] = y[1:] != y[:-1]
+    keep[-1] = True
+    return x[keep], y[keep]
+
+
+def minmax_decimate(x, y, width):
+    # first, min, max and last point of every pixel column (M4), the drawn line looks the same
+    if width < 1 or len(x) <= 4 * width:
+        return x, y
+
+    span = x[-1] - x[0]
+    if span <= 0:
+        return x, y
+    columns = np.minimum(((x - x[0]) * (width / span)).astype(np.int64), width - 1)
+
+    starts = np.flatnonzero(np.diff(columns)) + 1
+    first = np.concatenate(([0], starts))
+    last = np.concatenate((starts - 1, [len(x) - 1]))
+
+    # sort by column, then by value: first index of a column = min, last = max
+    order = np.lexsort((y, columns))
+    minimum = order[first]
+    maximum = order[last]
+
+    keep = np.unique(np.concatenate((first, last, minimum, maximum)))
+    return x[keep], y[keep]
+
+
+def decimate(x, y, width, is_binary):
+    # cost of drawing depends on the screen width, not on the number of points
+    if is_binary:
+        x, y = step_edges(x, y)
+    return minmax_decimate(x, y, width)
+
+
+def parse_statistics(rows):
+    # rows from recorder/statistics_during_period: start (ms since epoch, ISO string in older HA), mean, min, max
+    if not rows:
+        return np.empty(0), np.empty(0), np.empty(0), np.empty(0)
+
+    starts = [row["start"] for row in rows]
+    if isinstance(starts[0], str):
+        x = parse_timestamps(starts)
+    else:
+        x = np.array(starts, dtype=np.float64) / 1000
+
+    mean = np.array([row.get("mean") for row in rows], dtype=np.float64)
+    low = np.array([row.get("min") for row in rows], dtype=np.float64)
+    high = np.array([row.get("max") for row in rows], dtype=np.float64)
+
+    valid = ~np.isnan(mean)
+    return x[valid], mean[valid], low[valid], high[valid]
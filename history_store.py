@@ -0,0 +1,154 @@
+import os
+import time
+import sqlite3
+import threading
+
+
+# Lokalna kopia historii sensorow (SQLite). Wykres czyta najpierw stad i pobiera z HA
+# tylko brakujacy kawalek. WAL + synchronous=NORMAL: po naglym wylaczeniu zasilania baza
+# nie jest uszkodzona, najwyzej brakuje ostatnich zapisow, ktore zostana pobrane ponownie.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    entity_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (entity_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS points_ts ON points (ts);
+CREATE TABLE IF NOT EXISTS coverage (
+    entity_id TEXT PRIMARY KEY,
+    covered_from REAL NOT NULL,
+    covered_until REAL NOT NULL
+);
+"""
+
+
+class HistoryStore:
+    def __init__(self, path, retention_hours=48, max_size_mb=50):
+        self.path = path
+        self.retention = retention_hours * 3600
+        self.max_size = max_size_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.last_prune = 0
+        # open() checks the whole file and prune() may vacuum it, both run in start() on a worker thread;
+        # load and save wait until it is done
+        self.conn = None
+        self.ready = threading.Event()
+
+    def start(self):
+        try:
+            self.conn = self.open()
+            self.prune()
+        except sqlite3.Error as e:
+            print(f"history cache disabled: {e}")
+        finally:
+            self.ready.set()
+
+    def open(self):
+        try:
+            conn = self.connect()
+            if conn.execute("PRAGMA quick_check").fetchone()[0] == "ok":
+                return conn
+            conn.close()
+        except sqlite3.DatabaseError as e:
+            print(f"history cache error: {e}")
+
+        # uszkodzony plik jest odkladany na bok, historia zostanie pobrana z HA od nowa
+        print("history cache damaged, starting a new one")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.replace(self.path + suffix, self.path + suffix + ".corrupt")
+        return self.connect()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        # auto_vacuum has to be set before the first table is created
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def load(self, entity_id, start):
+        # None = brak ciaglych danych od start, trzeba pobrac cale okno
+        self.ready.wait()
+        if self.conn is None:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT covered_from, covered_until FROM coverage WHERE entity_id = ?",
+                (entity_id,)).fetchone()
+            if row is None or row[0] > start:
+                return None
+            points = self.conn.execute(
+                "SELECT ts, value FROM points WHERE entity_id = ? AND ts >= ? ORDER BY ts",
+                (entity_id, start)).fetchall()
+            # wartosc na poczatku okna = ostatni punkt przed start (rzadko zmieniane sensory, drzwi)
+            before = self.conn.execute(
+                "SELECT value FROM points WHERE entity_id = ? AND ts < ? ORDER BY ts DESC LIMIT 1",
+                (entity_id, start)).fetchone()
+
+        timestamps = [p[0] for p in points]
+        values = [p[1] for p in points]
+        if before is not None and (not timestamps or timestamps[0] > start):
+            timestamps.insert(0, start)
+            values.insert(0, before[0])
+        return timestamps, values, row[1]
+
+    def save(self, entity_id, timestamps, values, covered_until, covered_from=None):
+        # covered_from is given when the whole window was downloaded, otherwise the range is extended
+        self.ready.wait()
+        if self.conn is None:
+            return
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO points (entity_id, ts, value) VALUES (?, ?, ?)",
+                    [(entity_id, ts, value) for ts, value in zip(timestamps, values)])
+                if covered_from is not None:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO coverage (entity_id, covered_from, covered_until) VALUES (?, ?, ?)",
+                        (entity_id, covered_from, covered_until))
+                else:
+                    self.conn.execute(
+                        "UPDATE coverage SET covered_until = ? WHERE entity_id = ?",
+                        (covered_until, entity_id))
+
+        if time.monotonic() - self.last_prune > 600:
+            self.prune()
+
+    def size(self):
+        return sum(os.path.getsize(self.path + suffix)
+                   for suffix in ("", "-wal") if os.path.exists(self.path + suffix))
+
+    def prune(self):
+        self.last_prune = time.monotonic()
+        with self.lock:
+            with self.conn:
+                self.drop_before(time.time() - self.retention)
+
+            # przy przekroczeniu rozmiaru usuwana jest najstarsza czwarta czesc punktow
+            for _ in range(8):
+                if self.size() <= self.max_size:
+                    break
+                row = self.conn.execute(
+                    "SELECT ts FROM points ORDER BY ts LIMIT 1 OFFSET (SELECT COUNT(*) / 4 FROM points)").fetchone()
+                if row is None:
+                    break
+                with self.conn:
+                    self.drop_before(row[0])
+                # executescript runs the pragma to the end, execute() frees only one page
+                self.conn.executescript("PRAGMA incremental_vacuum;")
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def drop_before(self, cutoff):
+        # the last older point of a covered sensor moves to cutoff, it is still the value there
+        self.conn.execute(
+            "INSERT OR IGNORE INTO points (entity_id, ts, value) "
+            "SELECT entity_id, ?, value FROM (SELECT entity_id, MAX(ts), value FROM points WHERE ts < ? GROUP BY entity_id) "
+            "WHERE entity_id IN (SELECT entity_id FROM coverage WHERE covered_until >= ?)",
+            (cutoff, cutoff, cutoff))
+        self.conn.execute("DELETE FROM points WHERE ts < ?", (cutoff,))
+        self.conn.execute("DELETE FROM coverage WHERE covered_until < ?", (cutoff,))
+        self.conn.execute("UPDATE coverage SET covered_from = ? WHERE covered_from < ?", (cutoff, cutoff))
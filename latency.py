@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import bisect
+import threading
+from datetime import datetime
+
+
+# Pomiar opoznien na drodze HA -> widget i widget -> HA, z podzialem na etapy.
+# Inbound:  network (time_fired/lu -> on_message, zegary HA i panelu musza byc zsynchronizowane),
+#           decode (json.loads), queue (do obslugi w watku GUI), update (updatery),
+#           paint (do konca nastepnego odrysowania okna), total (on_message -> odrysowanie).
+# Outbound: input (ruch suwaka -> wyslanie), result (call_service -> result), echo (result -> nowy stan).
+
+STAGES = ("network", "decode", "queue", "update", "paint", "total", "input", "result", "echo")
+
+# bucket upper edges in seconds, 10 per decade from 10 us to 100 s
+BUCKET_EDGES = [10 ** (exponent / 10) for exponent in range(-50, 21)]
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKET_EDGES, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        # upper edge of the bucket holding the percentile (about 25% resolution)
+        target = fraction * self.count
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target and count:
+                return min(BUCKET_EDGES[index], self.max) if index < len(BUCKET_EDGES) else self.max
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class LatencyTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        # eid -> (received, decoded) of a state waiting for the GUI thread
+        self.waiting = {}
+        # (received, updated) of states drawn into widgets, waiting for the paint
+        self.unpainted = []
+        # eid -> time of the first slider move not sent yet / of a result waiting for its state
+        self.inputs = {}
+        self.echoes = {}
+
+    def add(self, stage, seconds):
+        if seconds < 0:
+            return
+        with self.lock:
+            self.histograms[stage].add(seconds)
+
+    # inbound, websocket thread
+    def received(self, eid, received, decoded, event_time=None):
+        if event_time is not None:
+            self.add("network", time.time() - event_time)
+        self.add("decode", decoded - received)
+        with self.lock:
+            self.waiting.setdefault(eid, (received, decoded))
+            result_time = self.echoes.pop(eid, None)
+        if result_time is not None:
+            self.add("echo", decoded - result_time)
+
+    # inbound, GUI thread
+    def applied(self, eid, started, finished):
+        with self.lock:
+            times = self.waiting.pop(eid, None)
+        if times is None:
+            return
+        self.add("queue", started - times[1])
+        self.add("update", finished - started)
+        self.unpainted.append((times[0], finished))
+
+    def painted(self):
+        if not self.unpainted:
+            return
+        now = time.monotonic()
+        for received, updated in self.unpainted:
+            self.add("paint", now - updated)
+            self.add("total", now - received)
+        self.unpainted = []
+
+    # outbound
+    def user_input(self, eid):
+        self.inputs.setdefault(eid, time.monotonic())
+
+    def command_sent(self, eid):
+        started = self.inputs.pop(eid, None)
+        if started is not None:
+            self.add("input", time.monotonic() - started)
+
+    def command_result(self, eid, sent_at):
+        now = time.monotonic()
+        self.add("result", now - sent_at)
+        with self.lock:
+            self.echoes[eid] = now
+
+    def summary(self):
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def overlay_text(self):
+        lines = [f"{'stage':<8}{'p50':>8}{'p95':>8}{'p99':>8}{'n':>7}"]
+        for stage, summary in self.summary().items():
+            if summary["count"]:
+                lines.append(f"{stage:<8}{summary['p50_ms']:>8.1f}{summary['p95_ms']:>8.1f}"
+                             f"{summary['p99_ms']:>8.1f}{summary['count']:>7}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        data = {"time": datetime.now().isoformat(timespec="seconds"), "stages": self.summary()}
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file, indent=1)
+        os.replace(temp_path, path)
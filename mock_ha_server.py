@@ -0,0 +1,849 @@
+# Lokalny zastepca Home Assistanta: websocket (auth, subscribe_events, subscribe_entities, get_states,
+# call_service, statistics) i REST (/api/states, /api/history/period), generator obciazenia
+# oraz nagrywanie prawdziwej sesji websocket i jej odtwarzanie (1x, 10x, max).
+# Tylko biblioteka standardowa, ramki websocket z ws_frames.py.
+#
+# Uruchomienie:
+#   python mock_ha_server.py --rate 5 --extra 500
+#   python mock_ha_server.py --scene-every 20 --scene-size 40 --entities big_entities.json --seed 3
+#   python mock_ha_server.py --upstream ws://192.168.1.110:8123/api/websocket --record evening.jsonl
+#   python mock_ha_server.py --replay evening.jsonl --speed 10
+# Panel: ha_ip = http://127.0.0.1:8123, ha_ip_ws = ws://127.0.0.1:8123/api/websocket
+# (przy nagrywaniu ha_ip zostaje adresem prawdziwego HA, przez mock idzie tylko websocket).
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import asyncio
+import argparse
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import ws_frames
+
+HA_VERSION = "2024.6.0"
+STATISTIC_PERIODS = {"5minute": 300, "hour": 3600, "day": 86400, "week": 604800, "month": 2592000}
+# domains of the generated entities (--extra), in turn
+EXTRA_DOMAINS = ("sensor", "light", "binary_sensor", "switch")
+
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def parse_iso(text):
+    moment = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def entity_domain(entity_id):
+    return entity_id.split(".", 1)[0]
+
+
+class MockHome:
+    # stany encji, historia zmian i polaczone sesje; kazda zmiana idzie do wszystkich subskrypcji
+    def __init__(self, seed=0, history_step=60):
+        self.seed = seed
+        self.history_step = history_step
+        self.started = time.time()
+        self.states = {}
+        # entity_id -> [(timestamp, state)] of changes made while the server runs
+        self.changes = {}
+        self.sessions = set()
+        self.context_counter = 0
+        self.events_sent = 0
+        self.bytes_sent = 0
+        self.subscribed = asyncio.Event()
+
+    def new_context(self):
+        self.context_counter += 1
+        return {"id": f"01MOCK{self.context_counter:020d}", "parent_id": None, "user_id": None}
+
+    def synthetic_noise(self, entity_id, timestamp):
+        return zlib.crc32(f"{entity_id}|{int(timestamp)}|{self.seed}".encode()) % 1000 / 1000
+
+    def synthetic_state(self, entity_id, timestamp):
+        # deterministic past values: daily sine around a per-entity level + noise
+        noise = self.synthetic_noise(entity_id, timestamp)
+        if entity_domain(entity_id) == "binary_sensor":
+            return "on" if noise < 0.2 else "off"
+        level = zlib.crc32(entity_id.encode()) % 30 + 5
+        return str(round(level + 3 * math.sin(timestamp / 86400 * 2 * math.pi) + noise, 2))
+
+    def initial_state(self, entity_id):
+        domain = entity_domain(entity_id)
+        attributes = {"friendly_name": entity_id.split(".", 1)[1].replace("_", " ")}
+        state = "on"
+        if domain == "light":
+            attributes.update(brightness=128, color_temp=300, hs_color=[30.0, 100.0],
+                              supported_color_modes=["color_temp", "hs"])
+        elif domain == "sensor":
+            state = self.synthetic_state(entity_id, self.started)
+            attributes.update(state_class="measurement", unit_of_measurement="°C")
+        elif domain == "binary_sensor":
+            state = self.synthetic_state(entity_id, self.started)
+        elif domain == "cover":
+            state = "open"
+            attributes["current_position"] = 40
+        elif domain == "fan":
+            attributes["percentage"] = 30
+        elif domain in ("number", "input_number"):
+            state = "3.0"
+            attributes.update(min=0, max=10, step=1)
+        elif domain in ("select", "input_select"):
+            state = "b"
+            attributes["options"] = ["a", "b", "c"]
+        elif domain == "switch":
+            state = "off"
+        return state, attributes
+
+    def add_entity(self, entity_id, state=None, attributes=None):
+        # initial state, no events
+        if state is None:
+            state, attributes = self.initial_state(entity_id)
+        context = self.new_context()
+        self.states[entity_id] = {
+            "entity_id": entity_id,
+            "state": state,
+            "attributes": attributes or {},
+            "last_changed": iso(self.started),
+            "last_updated": iso(self.started),
+            "context": context,
+        }
+
+    def set_state(self, entity_id, state, attributes):
+        now = time.time()
+        old = self.states.get(entity_id)
+        new = {
+            "entity_id": entity_id,
+            "state": state,
+            "attributes": attributes,
+            "last_changed": old["last_changed"] if old and old["state"] == state else iso(now),
+            "last_updated": iso(now),
+            "context": self.new_context(),
+        }
+        self.states[entity_id] = new
+        if old is None or old["state"] != state:
+            self.changes.setdefault(entity_id, []).append((now, state))
+        for session in list(self.sessions):
+            session.state_changed(entity_id, old, new, now)
+
+    def update(self, entity_id, state=None, **attributes):
+        # only the given values change, None removes an attribute
+        old = self.states.get(entity_id)
+        if old is None:
+            return
+        merged = dict(old["attributes"])
+        for key, value in attributes.items():
+            if value is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        self.set_state(entity_id, old["state"] if state is None else state, merged)
+
+    def remove(self, entity_id):
+        old = self.states.pop(entity_id, None)
+        if old is None:
+            return
+        now = time.time()
+        for session in list(self.sessions):
+            session.state_changed(entity_id, old, None, now)
+
+    async def drain(self):
+        # backpressure for the replay at max speed: wait until every panel has read its events
+        for session in list(self.sessions):
+            try:
+                await session.writer.drain()
+            except ConnectionError:
+                pass
+
+    def history(self, entity_id, start, end, minimal, no_attributes):
+        current = self.states.get(entity_id)
+        if current is None:
+            return []
+
+        points = []
+        if entity_domain(entity_id) in ("sensor", "binary_sensor"):
+            step = self.history_step
+            timestamp = max(start, math.floor(start / step) * step)
+            while timestamp < min(end, self.started):
+                state = self.synthetic_state(entity_id, timestamp)
+                if not points or points[-1][1] != state:
+                    points.append((timestamp, state))
+                timestamp += step
+        if not points:
+            points.append((start, current["state"]))
+        points.extend(change for change in self.changes.get(entity_id, []) if start <= change[0] <= end)
+
+        entries = []
+        for timestamp, state in points:
+            changed = iso(timestamp)
+            if minimal and entries:
+                entries.append({"state": state, "last_changed": changed})
+                continue
+            entry = {"entity_id": entity_id, "state": state, "last_changed": changed, "last_updated": changed}
+            if not no_attributes:
+                entry["attributes"] = current["attributes"]
+            entries.append(entry)
+        return entries
+
+    def statistics(self, statistic_ids, start, end, period):
+        bucket = STATISTIC_PERIODS.get(period, 3600)
+        result = {}
+        for entity_id in statistic_ids:
+            current = self.states.get(entity_id)
+            if current is None or current["attributes"].get("state_class") is None:
+                continue
+            rows = []
+            bucket_start = math.floor(start / bucket) * bucket
+            while bucket_start < end:
+                samples = []
+                timestamp = bucket_start
+                while timestamp < bucket_start + bucket:
+                    samples.append(float(self.synthetic_state(entity_id, timestamp)))
+                    timestamp += max(self.history_step, bucket // 60)
+                rows.append({
+                    "start": bucket_start * 1000,
+                    "end": (bucket_start + bucket) * 1000,
+                    "mean": sum(samples) / len(samples),
+                    "min": min(samples),
+                    "max": max(samples),
+                })
+                bucket_start += bucket
+            result[entity_id] = rows
+        return result
+
+
+def service_effect(domain, service, current, data):
+    # (new state, changed attributes) of call_service, None = unknown service
+    state = current["state"]
+    if service == "toggle":
+        service = "turn_off" if state == "on" else "turn_on"
+
+    if domain == "light":
+        if service == "turn_off" or data.get("brightness") == 0:
+            return "off", {"brightness": None}
+        if service == "turn_on":
+            changed = {key: data[key] for key in ("brightness", "color_temp", "hs_color") if key in data}
+            if "brightness_pct" in data:
+                changed["brightness"] = round(data["brightness_pct"] * 255 / 100)
+            if state != "on" and "brightness" not in changed:
+                changed["brightness"] = current["attributes"].get("brightness") or 255
+            return "on", changed
+    elif domain in ("switch", "fan", "input_boolean", "homeassistant"):
+        if service in ("turn_on", "turn_off"):
+            return service[5:], {}
+        if domain == "fan" and service == "set_percentage":
+            percentage = data.get("percentage", 0)
+            return ("on" if percentage else "off"), {"percentage": percentage}
+    elif domain == "cover":
+        if service == "set_cover_position":
+            position = data.get("position", 0)
+            return ("open" if position else "closed"), {"current_position": position}
+        if service in ("open_cover", "close_cover"):
+            return ("open", {"current_position": 100}) if service == "open_cover" else ("closed", {"current_position": 0})
+    elif domain in ("number", "input_number"):
+        if service == "set_value":
+            return str(float(data.get("value", 0))), {}
+    elif domain in ("select", "input_select"):
+        if service == "select_option":
+            return data.get("option"), {}
+    return None
+
+
+def random_change(entity_id, current, rng):
+    # one change of the load generator, by domain
+    domain = entity_domain(entity_id)
+    attributes = current["attributes"]
+    if domain == "sensor":
+        if is_number(current["state"]):
+            return str(round(float(current["state"]) + rng.uniform(-1, 1), 2)), {}
+        return str(round(rng.uniform(0, 100), 1)), {}
+    if domain == "binary_sensor":
+        return ("off" if current["state"] == "on" else "on"), {}
+    if domain == "light":
+        brightness = rng.randint(0, 255)
+        return ("on", {"brightness": brightness}) if brightness else ("off", {"brightness": None})
+    if domain in ("switch", "input_boolean"):
+        return ("off" if current["state"] == "on" else "on"), {}
+    if domain == "cover":
+        position = rng.randint(0, 100)
+        return ("open" if position else "closed"), {"current_position": position}
+    if domain == "fan":
+        return "on", {"percentage": rng.randint(0, 100)}
+    if domain in ("number", "input_number"):
+        return str(float(rng.randint(int(attributes.get("min", 0)), int(attributes.get("max", 10))))), {}
+    if domain in ("select", "input_select") and attributes.get("options"):
+        return rng.choice(attributes["options"]), {}
+    return current["state"], {}
+
+
+def is_number(text):
+    try:
+        float(text)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def entities_diff(old, new):
+    # "c" entry of subscribe_entities between two full states
+    plus = {}
+    timestamp = parse_iso(new["last_updated"])
+    if old is None or old["state"] != new["state"]:
+        plus["s"] = new["state"]
+        plus["lc"] = timestamp
+    else:
+        plus["lu"] = timestamp
+    old_attributes = old["attributes"] if old else {}
+    changed = {key: value for key, value in new["attributes"].items() if old_attributes.get(key) != value}
+    if changed:
+        plus["a"] = changed
+    plus["c"] = new["context"]["id"]
+    diff = {"+": plus}
+    removed = [key for key in old_attributes if key not in new["attributes"]]
+    if removed:
+        diff["-"] = {"a": removed}
+    return diff
+
+
+def entities_add(state_obj):
+    timestamp = parse_iso(state_obj["last_changed"])
+    compressed = {"s": state_obj["state"], "a": state_obj["attributes"],
+                  "c": state_obj["context"]["id"], "lc": timestamp}
+    updated = parse_iso(state_obj["last_updated"])
+    if updated != timestamp:
+        compressed["lu"] = updated
+    return compressed
+
+
+class Session:
+    # jedno polaczenie websocket panelu
+    def __init__(self, server, reader, writer, deflate=None):
+        self.server = server
+        self.home = server.home
+        self.reader = reader
+        self.writer = writer
+        # permessage-deflate when the panel asked for it, like aiohttp in HA
+        self.deflate = deflate
+        self.frames = ws_frames.FrameParser(deflate=deflate)
+        self.authenticated = False
+        # subscription id -> set of entity ids (subscribe_entities) or None (subscribe_events)
+        self.subscriptions = {}
+        self.handlers = {
+            "subscribe_events": self.subscribe_events,
+            "subscribe_entities": self.subscribe_entities,
+            "unsubscribe_events": self.unsubscribe,
+            "get_states": self.get_states,
+            "get_config": self.get_config,
+            "call_service": self.call_service,
+            "recorder/statistics_during_period": self.statistics,
+            "ping": self.ping,
+        }
+
+    def send(self, msg):
+        if self.writer.is_closing():
+            return
+        frame = ws_frames.encode_message(ws_frames.OP_TEXT, json.dumps(msg), deflate=self.deflate)
+        self.writer.write(frame)
+        self.home.events_sent += 1
+        self.home.bytes_sent += len(frame)
+
+    def result(self, msg_id, result=None):
+        self.send({"id": msg_id, "type": "result", "success": True, "result": result})
+
+    def error(self, msg_id, code, message):
+        self.send({"id": msg_id, "type": "result", "success": False, "error": {"code": code, "message": message}})
+
+    async def run(self):
+        self.send({"type": "auth_required", "ha_version": HA_VERSION})
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    return
+                for opcode, payload in self.frames.feed(data):
+                    if opcode == ws_frames.OP_TEXT:
+                        self.handle(json.loads(payload))
+                    elif opcode == ws_frames.OP_PING:
+                        self.writer.write(ws_frames.encode_frame(ws_frames.OP_PONG, payload))
+                    elif opcode == ws_frames.OP_CLOSE:
+                        self.writer.write(ws_frames.encode_close())
+                        return
+                await self.writer.drain()
+        except ws_frames.ProtocolError as e:
+            print(f"websocket protocol error: {e}")
+            self.writer.write(ws_frames.encode_close(ws_frames.CLOSE_PROTOCOL_ERROR))
+        finally:
+            self.home.sessions.discard(self)
+
+    def handle(self, msg):
+        if not self.authenticated:
+            if msg.get("type") != "auth":
+                return
+            if self.server.token and msg.get("access_token") != self.server.token:
+                self.send({"type": "auth_invalid", "message": "Invalid access token or password"})
+                self.writer.close()
+                return
+            self.authenticated = True
+            self.home.sessions.add(self)
+            self.send({"type": "auth_ok", "ha_version": HA_VERSION})
+            return
+
+        handler = self.handlers.get(msg.get("type"))
+        if handler is None:
+            self.error(msg.get("id"), "unknown_command", "Unknown command.")
+        else:
+            handler(msg)
+
+    def state_changed(self, entity_id, old, new, fired):
+        for sub_id, entity_ids in self.subscriptions.items():
+            if entity_ids is None:
+                self.send({"id": sub_id, "type": "event", "event": {
+                    "event_type": "state_changed",
+                    "data": {"entity_id": entity_id, "old_state": old, "new_state": new},
+                    "origin": "LOCAL",
+                    "time_fired": iso(fired),
+                    "context": (new or old)["context"],
+                }})
+            elif entity_id in entity_ids:
+                event = {"r": [entity_id]} if new is None else {"c": {entity_id: entities_diff(old, new)}}
+                self.send({"id": sub_id, "type": "event", "event": event})
+
+    def subscribe_events(self, msg):
+        if msg.get("event_type") not in (None, "state_changed"):
+            # other event types are never fired here
+            self.result(msg["id"])
+            return
+        self.subscriptions[msg["id"]] = None
+        self.result(msg["id"])
+        self.home.subscribed.set()
+
+    def subscribe_entities(self, msg):
+        entity_ids = set(msg.get("entity_ids") or self.home.states)
+        self.subscriptions[msg["id"]] = entity_ids
+        self.result(msg["id"])
+        self.send({"id": msg["id"], "type": "event", "event": {"a": {
+            entity_id: entities_add(self.home.states[entity_id])
+            for entity_id in entity_ids if entity_id in self.home.states
+        }}})
+        self.home.subscribed.set()
+
+    def unsubscribe(self, msg):
+        if self.subscriptions.pop(msg.get("subscription"), False) is False:
+            self.error(msg["id"], "not_found", "Subscription not found.")
+        else:
+            self.result(msg["id"])
+
+    def get_states(self, msg):
+        self.result(msg["id"], list(self.home.states.values()))
+
+    def get_config(self, msg):
+        self.result(msg["id"], {"version": HA_VERSION, "time_zone": "UTC", "state": "RUNNING"})
+
+    def ping(self, msg):
+        self.send({"id": msg["id"], "type": "pong"})
+
+    def call_service(self, msg):
+        domain = msg.get("domain")
+        service = msg.get("service")
+        data = dict(msg.get("service_data") or {})
+        entity_ids = data.pop("entity_id", None) or (msg.get("target") or {}).get("entity_id") or []
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+
+        effects = []
+        for entity_id in entity_ids:
+            current = self.home.states.get(entity_id)
+            if current is None:
+                continue
+            effect = service_effect(domain, service, current, data)
+            if effect is None:
+                self.error(msg["id"], "service_not_found", f"Service {domain}.{service} not found.")
+                return
+            effects.append((entity_id, effect))
+
+        self.result(msg["id"], {"context": self.home.new_context()})
+        # the device answers a moment after HA acknowledged the call
+        loop = asyncio.get_running_loop()
+        for entity_id, (state, attributes) in effects:
+            loop.call_later(self.server.service_delay, lambda e=entity_id, s=state, a=attributes:
+                            self.home.update(e, s, **a))
+
+    def statistics(self, msg):
+        try:
+            start = parse_iso(msg["start_time"])
+            end = parse_iso(msg["end_time"]) if msg.get("end_time") else time.time()
+        except (KeyError, ValueError):
+            self.error(msg.get("id"), "invalid_format", "Invalid start_time")
+            return
+        self.result(msg["id"], self.home.statistics(msg.get("statistic_ids") or [], start, end, msg.get("period")))
+
+
+class MockServer:
+    def __init__(self, home, token=None, service_delay=0.1, upstream=None, record=None, compress=True):
+        self.home = home
+        self.token = token
+        self.compress = compress
+        self.service_delay = service_delay
+        self.upstream = upstream
+        self.record_path = record
+        # one recording per server run, times counted from the first panel connection
+        self.record_file = None
+        self.record_started = None
+        self.rest_routes = [
+            ("/api/states/", self.rest_state),
+            ("/api/history/period", self.rest_history),
+            ("/api/states", self.rest_states),
+            ("/api/", self.rest_running),
+        ]
+
+    async def handle_connection(self, reader, writer):
+        # HTTP keep-alive: REST requests one after another, or an upgrade to websocket
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                request_line, headers = ws_frames.parse_http_head(head[:-4])
+                method, target = request_line.split(" ")[:2]
+                length = int(headers.get("content-length", 0))
+                if length:
+                    await reader.readexactly(length)
+
+                if headers.get("upgrade", "").lower() == "websocket":
+                    # the recording proxy passes messages through without compression on both sides
+                    extension, deflate = None, None
+                    if self.compress and not self.upstream:
+                        extension, deflate = ws_frames.server_deflate(headers)
+                    try:
+                        writer.write(ws_frames.server_handshake(
+                            headers, {"Sec-WebSocket-Extensions": extension} if extension else None))
+                    except ws_frames.ProtocolError:
+                        self.respond(writer, 400, {"message": "Bad websocket handshake"})
+                        return
+                    if self.upstream:
+                        await self.proxy(reader, writer)
+                    else:
+                        await Session(self, reader, writer, deflate).run()
+                    return
+
+                self.handle_rest(writer, method, target, headers)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status, body):
+        data = json.dumps(body).encode()
+        reason = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+
+    def handle_rest(self, writer, method, target, headers):
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            self.respond(writer, 401, {"message": "401: Unauthorized"})
+            return
+        if method != "GET":
+            self.respond(writer, 405, {"message": "Method not allowed"})
+            return
+        parts = urlsplit(target)
+        query = parse_qs(parts.query, keep_blank_values=True)
+        for prefix, handler in self.rest_routes:
+            if parts.path.startswith(prefix):
+                status, body = handler(unquote(parts.path[len(prefix):]).strip("/"), query)
+                self.respond(writer, status, body)
+                return
+        self.respond(writer, 404, {"message": "Not found"})
+
+    def rest_running(self, rest, query):
+        return (200, {"message": "API running."}) if not rest else (404, {"message": "Not found"})
+
+    def rest_states(self, rest, query):
+        return 200, list(self.home.states.values())
+
+    def rest_state(self, entity_id, query):
+        state = self.home.states.get(entity_id)
+        return (200, state) if state else (404, {"message": "Entity not found."})
+
+    def rest_history(self, start_text, query):
+        try:
+            end = parse_iso(query["end_time"][0]) if "end_time" in query else time.time()
+            start = parse_iso(start_text) if start_text else end - 86400
+        except ValueError:
+            return 400, {"message": "Invalid datetime"}
+        if "filter_entity_id" not in query:
+            return 400, {"message": "filter_entity_id is missing"}
+        minimal = "minimal_response" in query
+        no_attributes = "no_attributes" in query
+        result = []
+        for entity_id in query["filter_entity_id"][0].split(","):
+            entries = self.home.history(entity_id.strip(), start, end, minimal, no_attributes)
+            if entries:
+                result.append(entries)
+        return 200, result
+
+    async def proxy(self, reader, writer):
+        # nagrywanie: panel <-> mock <-> prawdziwe HA, kazda wiadomosc tekstowa trafia do pliku
+        try:
+            upstream_reader, upstream_writer = await open_websocket(self.upstream)
+        except (OSError, ws_frames.ProtocolError) as e:
+            print(f"upstream error: {e}")
+            writer.write(ws_frames.encode_close(1011, "upstream unavailable"))
+            return
+
+        loop = asyncio.get_running_loop()
+        if self.record_file is None:
+            self.record_file = open(self.record_path, "w")
+            self.record_started = loop.time()
+            print(f"recording to {self.record_path}")
+
+        def write(direction, payload):
+            msg = json.loads(payload)
+            if isinstance(msg, dict) and msg.get("type") == "auth":
+                msg = dict(msg, access_token="***")
+            entry = {"t": round(loop.time() - self.record_started, 4), "dir": direction, "msg": msg}
+            self.record_file.write(json.dumps(entry) + "\n")
+
+        to_panel = asyncio.ensure_future(pump_frames(upstream_reader, writer, False, lambda p: write("in", p)))
+        to_ha = asyncio.ensure_future(pump_frames(reader, upstream_writer, True, lambda p: write("out", p)))
+        await asyncio.wait([to_panel, to_ha], return_when=asyncio.FIRST_COMPLETED)
+        for task in (to_panel, to_ha):
+            task.cancel()
+        upstream_writer.close()
+        self.record_file.flush()
+        print("panel disconnected, recording continues with the next connection")
+
+
+async def open_websocket(url):
+    parts = urlsplit(url)
+    secure = parts.scheme == "wss"
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or (443 if secure else 80),
+                                                   ssl=True if secure else None)
+    key = ws_frames.new_key()
+    writer.write(ws_frames.client_handshake(parts.netloc, parts.path or "/", key))
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, headers = ws_frames.parse_http_head(head[:-4])
+    ws_frames.check_server_handshake(status_line, headers, key)
+    return reader, writer
+
+
+async def pump_frames(reader, writer, mask, on_text):
+    # frames are decoded and encoded again: a client masks, a server does not
+    frames = ws_frames.FrameParser()
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        for opcode, payload in frames.feed(data):
+            if opcode == ws_frames.OP_TEXT:
+                on_text(payload)
+            writer.write(ws_frames.encode_frame(opcode, payload, mask))
+            if opcode == ws_frames.OP_CLOSE:
+                return
+        await writer.drain()
+
+
+async def generate_load(home, rate, scene_every, scene_size, rng):
+    # single random changes at "rate" per second, every "scene_every" seconds a scene:
+    # "scene_size" lights change in the same moment (like an evening scene in HA)
+    loop = asyncio.get_running_loop()
+    entity_ids = sorted(home.states)
+    lights = [entity_id for entity_id in entity_ids if entity_domain(entity_id) == "light"]
+    next_change = loop.time()
+    next_scene = loop.time() + scene_every if scene_every else None
+
+    while True:
+        now = loop.time()
+        if rate:
+            while next_change <= now:
+                entity_id = rng.choice(entity_ids)
+                if entity_id in home.states:
+                    state, attributes = random_change(entity_id, home.states[entity_id], rng)
+                    home.update(entity_id, state, **attributes)
+                next_change += 1 / rate
+        if next_scene is not None and next_scene <= now:
+            brightness = rng.choice([0, 60, 150, 255])
+            for entity_id in rng.sample(lights, min(scene_size, len(lights))):
+                home.update(entity_id, "on" if brightness else "off", brightness=brightness or None)
+            next_scene += scene_every
+
+        wakeups = [next_change] if rate else []
+        if next_scene is not None:
+            wakeups.append(next_scene)
+        if not wakeups:
+            return
+        await asyncio.sleep(max(min(wakeups) - loop.time(), 0))
+
+
+def read_recording(path):
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                if entry.get("dir") == "in":
+                    msg = entry["msg"]
+                    for item in (msg if isinstance(msg, list) else [msg]):
+                        yield entry["t"], item
+
+
+def recorded_states(path):
+    # states at the start of the recording: get_states result or the first "a" event
+    for _, msg in read_recording(path):
+        if msg.get("type") == "result" and isinstance(msg.get("result"), list) \
+                and msg["result"] and isinstance(msg["result"][0], dict) and "entity_id" in msg["result"][0]:
+            return {state["entity_id"]: (state["state"], state.get("attributes", {})) for state in msg["result"]}
+        event = msg.get("event") or {}
+        if msg.get("type") == "event" and "a" in event:
+            return {entity_id: (compressed.get("s"), compressed.get("a", {}))
+                    for entity_id, compressed in event["a"].items()}
+    return {}
+
+
+def replay_message(home, msg):
+    # recorded event -> changes of MockHome, sent again in the format the panel subscribed to
+    event = msg.get("event") or {}
+    if msg.get("type") != "event":
+        return 0
+    if event.get("event_type") == "state_changed":
+        data = event.get("data", {})
+        new_state = data.get("new_state")
+        if new_state is None:
+            home.remove(data.get("entity_id"))
+        else:
+            home.set_state(new_state["entity_id"], new_state["state"], new_state.get("attributes", {}))
+        return 1
+
+    count = 0
+    for entity_id, compressed in event.get("a", {}).items():
+        # the first "a" event holds the initial states, later ones are new entities
+        current = home.states.get(entity_id)
+        if current is None or current["state"] != compressed.get("s") or current["attributes"] != compressed.get("a", {}):
+            home.set_state(entity_id, compressed.get("s"), compressed.get("a", {}))
+            count += 1
+    for entity_id, diff in event.get("c", {}).items():
+        current = home.states.get(entity_id)
+        if current is None:
+            continue
+        plus = diff.get("+", {})
+        attributes = dict(current["attributes"])
+        attributes.update(plus.get("a", {}))
+        for key in diff.get("-", {}).get("a", []):
+            attributes.pop(key, None)
+        home.set_state(entity_id, plus.get("s", current["state"]), attributes)
+        count += 1
+    for entity_id in event.get("r", []):
+        home.remove(entity_id)
+        count += 1
+    return count
+
+
+async def replay(home, path, speed):
+    # starts when the first panel subscribed; speed = None means as fast as the panels read
+    await home.subscribed.wait()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    first = None
+    changes = 0
+    for index, (timestamp, msg) in enumerate(read_recording(path)):
+        if msg.get("type") != "event":
+            continue
+        if first is None:
+            first = timestamp
+        if speed:
+            delay = started + (timestamp - first) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        changes += replay_message(home, msg)
+        if not speed and index % 100 == 0:
+            await home.drain()
+    print(f"replay finished: {changes} changes in {loop.time() - started:.1f} s")
+
+
+async def report(home, interval=10):
+    sent = 0
+    sent_bytes = 0
+    while True:
+        await asyncio.sleep(interval)
+        print(f"{len(home.sessions)} panel(s), {(home.events_sent - sent) / interval:.1f} messages/s, "
+              f"{(home.bytes_sent - sent_bytes) / interval / 1024:.1f} KiB/s")
+        sent = home.events_sent
+        sent_bytes = home.bytes_sent
+
+
+def parse_args():
+    base = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Local mock of the Home Assistant websocket and REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--token", help="required access token, any token is accepted when not set")
+    parser.add_argument("--entities", default=os.path.join(base, "entities_list.json"),
+                        help="entities_list.json with the entities of the mock house")
+    parser.add_argument("--extra", type=int, default=0, help="additional generated entities (not on the panel)")
+    parser.add_argument("--rate", type=float, default=1.0, help="random state changes per second, 0 = none")
+    parser.add_argument("--scene-every", type=float, default=0, help="seconds between light scenes, 0 = none")
+    parser.add_argument("--scene-size", type=int, default=20, help="lights changed by one scene")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history-step", type=int, default=60, help="seconds between generated history points")
+    parser.add_argument("--no-compress", action="store_true", help="do not accept permessage-deflate")
+    parser.add_argument("--service-delay-ms", type=float, default=100, help="delay of the new state after call_service")
+    parser.add_argument("--upstream", help="websocket url of a real HA, the session is forwarded and recorded")
+    parser.add_argument("--record", default="session.jsonl", help="recording file (with --upstream)")
+    parser.add_argument("--replay", help="recording to play back instead of the load generator")
+    parser.add_argument("--speed", default="1", help="replay speed: 1, 10 ... or max")
+    return parser.parse_args()
+
+
+async def serve(args):
+    home = MockHome(args.seed, args.history_step)
+    with open(args.entities) as file:
+        groups = json.load(file)
+    for entities in groups.values():
+        for entity in entities:
+            home.add_entity(entity["entity_id"])
+    for index in range(args.extra):
+        domain = EXTRA_DOMAINS[index % len(EXTRA_DOMAINS)]
+        home.add_entity(f"{domain}.mock_{index}")
+    if args.replay:
+        for entity_id, (state, attributes) in recorded_states(args.replay).items():
+            home.add_entity(entity_id, state, attributes)
+
+    server = MockServer(home, args.token, args.service_delay_ms / 1000, args.upstream, args.record,
+                        not args.no_compress)
+    listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+    if args.upstream:
+        print(f"websocket on ws://{args.host}:{args.port}/api/websocket forwarded to {args.upstream}")
+    else:
+        print(f"mock HA on http://{args.host}:{args.port}, {len(home.states)} entities")
+
+    tasks = []
+    if not args.upstream:
+        tasks.append(asyncio.ensure_future(report(home)))
+    if args.replay:
+        speed = None if args.speed == "max" else float(args.speed)
+        tasks.append(asyncio.ensure_future(replay(home, args.replay, speed)))
+    elif not args.upstream:
+        tasks.append(asyncio.ensure_future(
+            generate_load(home, args.rate, args.scene_every, args.scene_size, random.Random(args.seed))))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
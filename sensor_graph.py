@@ -1,39 +1,46 @@
 import sys
 import math
 import os
+import time
 import numpy as np
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 import requests
-from configparser import ConfigParser
-
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton, QSizePolicy
-from PyQt5.QtCore import QTimer, Qt
+from requests.adapters import HTTPAdapter
+from app_config import config, config_path
+from history_store import HistoryStore
+from history_data import parse_history, parse_statistics, state_to_value, decimate
+import ha_codec
+
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QSizePolicy
+from PyQt5.QtCore import QTimer, Qt, QObject, QRunnable, QThreadPool, pyqtSignal
 from PyQt5.QtGui import QFont
 import pyqtgraph as pg
 
-def get_config_path():
-    if getattr(sys, 'frozen', False):
-        base_path = os.path.dirname(sys.executable)
-    else:
-        base_path = os.path.dirname(os.path.abspath(__file__))
-
-    return os.path.join(base_path, "config.ini")
-
-config_path = get_config_path()
-config_object = ConfigParser()
-config_object.read(config_path)
-
-if "ha" not in config_object:
-    print("no config.ini!")
-    sys.exit(1)
-
-config = config_object["ha"]
-
-
 HA_TOKEN = config["ha_token"]
 HA_URL = config["ha_ip"]
 screen_settings = config["screen"]
 
+HISTORY_WINDOW = timedelta(hours=6)
+# nazwa, zakres, okres statystyk HA (None = surowa historia)
+RANGES = [
+    ("1h", timedelta(hours=1), None),
+    ("6h", timedelta(hours=6), None),
+    ("24h", timedelta(hours=24), "5minute"),
+    ("7d", timedelta(days=7), "hour"),
+    ("30d", timedelta(days=30), "hour"),
+]
+DEFAULT_RANGE = 1
+# local history cache, empty history_cache = disabled
+HISTORY_CACHE = config.get("history_cache", "history_cache.sqlite")
+HISTORY_RETENTION_HOURS = config.getfloat("history_retention_hours", 48)
+HISTORY_CACHE_MB = config.getfloat("history_cache_mb", 50)
+# how many recently viewed sensors keep their history in memory
+CHART_CACHE_SENSORS = config.getint("chart_cache_sensors", 8)
+
+# odstepy etykiet czasu na osi X (sekundy)
+TICK_SPACINGS = [60, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400, 172800, 604800]
+
 def load_stylesheet(path):
     with open(path, "r") as file:
         return file.read()
@@ -43,9 +50,37 @@ class VerticalAxis(pg.AxisItem):
         super().__init__(orientation=orientation)
         self._angle = -90  # obrót etykiety
         self._height_updated = False
+        self.max_ticks = 10
+        self.time_format = "%H:%M"
+        # timestamp -> label, ticks are aligned so the same values come back after every pan/refresh
+        self.labels = {}
+
+    def tickValues(self, minVal, maxVal, size):
+        # ticks on full minutes/hours/days of the visible range, not on data points
+        span = maxVal - minVal
+        if span <= 0:
+            return []
+        spacing = next((s for s in TICK_SPACINGS if span / s <= self.max_ticks), TICK_SPACINGS[-1])
+
+        time_format = "%H:%M" if span <= 86400 else "%d.%m %H:%M"
+        if time_format != self.time_format:
+            self.time_format = time_format
+            self.labels.clear()
+
+        offset = datetime.fromtimestamp(minVal).astimezone().utcoffset().total_seconds()
+        first = math.ceil((minVal + offset) / spacing) * spacing - offset
+        return [(spacing, list(np.arange(first, maxVal, spacing)))]
 
     def tickStrings(self, values, scale, spacing):
-        return [datetime.fromtimestamp(value).strftime("%H:%M") for value in values]
+        if len(self.labels) > 1000:
+            self.labels.clear()
+        labels = []
+        for value in values:
+            label = self.labels.get(value)
+            if label is None:
+                label = self.labels[value] = datetime.fromtimestamp(value).strftime(self.time_format)
+            labels.append(label)
+        return labels
 
     def drawPicture(self, p, axisSpec, tickSpecs, textSpecs):
         super().drawPicture(p, axisSpec, tickSpecs, [])
@@ -79,65 +114,236 @@ class VerticalAxis(pg.AxisItem):
             self._height_updated = True
 
 
-def get_sensor_history(sensor_id):
-    headers = {
-        "Authorization": f"Bearer {HA_TOKEN}",
-        "Content-Type": "application/json",
-    }
+class SensorHistoryBuffer:
+    # bufor (timestamp, value) jednego sensora, punkty starsze niz okno sa wyrzucane
+    def __init__(self, window, capacity=1024):
+        self.window = window.total_seconds()
+        self.ts = np.empty(capacity, dtype=float)
+        self.values = np.empty(capacity, dtype=float)
+        self.start = 0
+        self.end = 0
+        self.is_binary = False
+
+    def __len__(self):
+        return self.end - self.start
 
-    meta_url = f"{HA_URL}/api/states/{sensor_id}"
-    meta_response = requests.get(meta_url, headers=headers)
-    if meta_response.status_code != 200:
-        raise Exception(f"nie udalo sie pobrac metadanych sensora: {meta_response.status_code}")
-    meta_data = meta_response.json()
+    def last_timestamp(self):
+        if self.end == self.start:
+            return None
+        return self.ts[self.end - 1]
 
-    is_binary = sensor_id.startswith("binary_sensor.") or meta_data.get("attributes", {}).get("device_class") in ["window", "door", "opening"]
+    def extend(self, timestamps, values):
+        timestamps = np.asarray(timestamps, dtype=float)
+        values = np.asarray(values, dtype=float)
 
-    now_utc = datetime.utcnow()
-    now = now_utc + timedelta(hours=2)  
-    start = now - timedelta(hours=6)
-    start_iso = start.isoformat()
-    end_iso = now.isoformat()
+        # history from start_time repeats the last known point, keep only newer ones
+        last = self.last_timestamp()
+        if last is not None:
+            newer = timestamps > last
+            timestamps = timestamps[newer]
+            values = values[newer]
 
-    url = f"{HA_URL}/api/history/period/{start_iso}?end_time={end_iso}&filter_entity_id={sensor_id}&significant_changes=true"
-    response = requests.get(url, headers=headers)
+        count = len(timestamps)
+        if count == 0:
+            return
+
+        if self.end + count > len(self.ts):
+            self.compact(len(self) + count)
+
+        self.ts[self.end:self.end + count] = timestamps
+        self.values[self.end:self.end + count] = values
+        self.end += count
+
+    def compact(self, needed):
+        # przesuniecie aktualnych punktow na poczatek, powiekszenie tylko gdy brakuje miejsca
+        size = len(self)
+        capacity = len(self.ts)
+        while capacity < needed * 2:
+            capacity *= 2
+
+        if capacity != len(self.ts):
+            ts = np.empty(capacity, dtype=float)
+            values = np.empty(capacity, dtype=float)
+        else:
+            ts, values = self.ts, self.values
+
+        ts[:size] = self.ts[self.start:self.end]
+        values[:size] = self.values[self.start:self.end]
+        self.ts, self.values = ts, values
+        self.start, self.end = 0, size
+
+    def evict(self, now):
+        cutoff = now - self.window
+        index = self.start + np.searchsorted(self.ts[self.start:self.end], cutoff)
+        # one point before the window is kept so that a step plot starts with the right state
+        self.start = max(self.start, index - 1)
+
+    def arrays(self):
+        return self.ts[self.start:self.end], self.values[self.start:self.end]
+
+
+# sensor_id -> SensorHistoryBuffer, least recently viewed first
+history_buffers = OrderedDict()
+
+
+def get_history_buffer(sensor_id):
+    buffer = history_buffers.get(sensor_id)
+    if buffer is None:
+        buffer = history_buffers[sensor_id] = SensorHistoryBuffer(HISTORY_WINDOW)
+    history_buffers.move_to_end(sensor_id)
+    while len(history_buffers) > max(CHART_CACHE_SENSORS, 1):
+        history_buffers.popitem(last=False)
+    return buffer
+
+
+class HARestClient:
+    # jedna sesja keep-alive dla wszystkich zapytan REST + cache atrybutow encji
+    def __init__(self, base_url, token, meta_ttl=3600):
+        self.base_url = base_url
+        self.meta_ttl = meta_ttl
+        self.meta_cache = {}
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, path, params=None):
+        return self.session.get(f"{self.base_url}{path}", params=params, timeout=30)
+
+    def get_attributes(self, entity_id):
+        cached = self.meta_cache.get(entity_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        response = self.get(f"/api/states/{entity_id}")
+        if response.status_code != 200:
+            raise Exception(f"nie udalo sie pobrac metadanych sensora: {response.status_code}")
+        attributes = ha_codec.loads(response.content).get("attributes", {})
+        self.meta_cache[entity_id] = (time.monotonic() + self.meta_ttl, attributes)
+        return attributes
+
+
+rest_client = HARestClient(HA_URL, HA_TOKEN)
+
+history_store = None
+if HISTORY_CACHE:
+    history_store = HistoryStore(
+        os.path.join(os.path.dirname(config_path), HISTORY_CACHE),
+        max(HISTORY_RETENTION_HOURS, HISTORY_WINDOW.total_seconds() / 3600),
+        HISTORY_CACHE_MB)
+
+
+def get_sensor_history(sensor_id, start_time=None, attributes=None):
+    # attributes can come from the websocket state, otherwise they are read (and cached) over REST
+    if attributes is None:
+        attributes = rest_client.get_attributes(sensor_id)
+
+    is_binary = sensor_id.startswith("binary_sensor.") or attributes.get("device_class") in ["window", "door", "opening"]
+
+    now = time.time()
+    start = start_time.timestamp() if start_time is not None else now - HISTORY_WINDOW.total_seconds()
+
+    # najpierw lokalna kopia, z HA tylko brakujacy kawalek od ostatniego pobrania
+    cached_ts, cached_values = [], []
+    fetch_from = start
+    cached = None
+    if history_store is not None:
+        cached = history_store.load(sensor_id, start)
+        if cached is not None:
+            cached_ts, cached_values, fetch_from = cached
+
+    # minimal_response + no_attributes: only state and last_changed for every point
+    params = {
+        "end_time": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+        "filter_entity_id": sensor_id,
+        "significant_changes": "true",
+        "minimal_response": "",
+        "no_attributes": "",
+    }
+    start_iso = datetime.fromtimestamp(fetch_from, timezone.utc).isoformat()
+    response = rest_client.get(f"/api/history/period/{start_iso}", params)
     if response.status_code != 200:
         raise Exception(f"blad pobierania danych: {response.status_code} – {response.text}")
 
-    data = response.json()
-    timestamps, values = [], []
+    data = ha_codec.loads(response.content)
+    timestamps, values = parse_history(data[0] if data else [], is_binary)
+
+    if fetch_from > start:
+        # the state at fetch_from is already in the cache
+        newer = timestamps > fetch_from
+        timestamps, values = timestamps[newer], values[newer]
+
+    if history_store is not None:
+        # the range is only extended while the cache covers start; fetch_from can be older than start
+        # (the live chart asks from its last websocket point), covered_from must not move forward then
+        history_store.save(sensor_id, timestamps.tolist(), values.tolist(), now, None if cached is not None else start)
+
+    return np.concatenate((cached_ts, timestamps)), np.concatenate((cached_values, values)), is_binary
+
+
+class HistoryLoaderSignals(QObject):
+    loaded = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
 
-    for entry in data[0]:
+
+class HistoryLoader(QRunnable):
+    # pobieranie i parsowanie historii poza watkiem GUI, wynik wraca sygnalem
+    def __init__(self, generation, sensor_id, start_time, attributes=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.generation = generation
+        self.sensor_id = sensor_id
+        self.start_time = start_time
+        self.attributes = attributes
+        self.signals = HistoryLoaderSignals()
+
+    def run(self):
         try:
-            timestamp = datetime.fromisoformat(entry['last_updated'].replace('Z', '+00:00'))
-            state_str = entry['state'].lower()
+            timestamps, values, is_binary = get_sensor_history(self.sensor_id, self.start_time, self.attributes)
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        self.signals.loaded.emit(self.generation, (timestamps, values, is_binary))
 
-            if is_binary:
-                state_map = {"on": 1, "off": 0, "open": 1, "closed": 0}
-                if state_str in state_map:
-                    value = state_map[state_str]
-                else:
-                    continue
-            else:
-                value = float(entry['state'])
 
-            timestamps.append(timestamp)
-            values.append(value)
-        except (ValueError, KeyError):
-            continue
+history_pool = QThreadPool()
+history_pool.setMaxThreadCount(2)
 
-    return timestamps, values, is_binary
+
+class HistoryStoreOpener(QRunnable):
+    # the cache is checked and pruned off the GUI thread, the first HistoryLoader waits for it
+    def __init__(self, store):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.store = store
+
+    def run(self):
+        self.store.start()
+
+
+history_store_opener = None
+if history_store is not None:
+    history_store_opener = HistoryStoreOpener(history_store)
+    history_pool.start(history_store_opener)
 
 
 class SensorChartWindow(QMainWindow):
-    def __init__(self, sensor_id):
+    # emitted from the websocket thread with the statistics_during_period answer
+    statistics_loaded = pyqtSignal(int, object)
+
+    def __init__(self, sensor_id=None, live=False, state_lookup=None, ws_request=None):
         super().__init__()
         global screen_settings
-        self.setWindowTitle(f"Wykres: {sensor_id}")
         self.resize(1000, 600)
         if ( screen_settings == "full"):
             self.setWindowFlag(Qt.FramelessWindowHint)
-            self.showFullScreen()
+            # the window can be created hidden and shown later, the state is kept until then
+            self.setWindowState(Qt.WindowFullScreen)
         else:
            print("no full screen")
         main_widget = QWidget()
@@ -158,17 +364,65 @@ class SensorChartWindow(QMainWindow):
 
         self.plot = self.plot_widget.getPlotItem()
         self.plot.showGrid(x=True, y=True)
+        # plot items are created once and only get new data (setData), plot.clear() is not used
+        self.line_curve = self.plot.plot(pen=pg.mkPen(color='#1c9bf0', width=2))
+        self.step_curve = self.plot.plot(stepMode=True, fillLevel=0, brush=(0, 128, 255, 100), pen=pg.mkPen(color='#0077CC', width=2))
+        # band edges are not drawn themselves, only the area between them
+        self.band_low = pg.PlotCurveItem()
+        self.band_high = pg.PlotCurveItem()
+        self.band = pg.FillBetweenItem(self.band_low, self.band_high, brush=(28, 155, 240, 60))
+        self.plot.addItem(self.band)
+        self.curve = None
+        self.plot_style = None
+        self.show_curves(None)
+        # po zoomie/przesunieciu punkty sa decymowane ponownie dla widocznego zakresu
+        self.decimate_timer = QTimer()
+        self.decimate_timer.setSingleShot(True)
+        self.decimate_timer.setInterval(50)
+        self.decimate_timer.timeout.connect(self.redecimate)
+        self.plot.sigXRangeChanged.connect(self.view_changed)
      #   self.plot.setLabel('left', 'Wartość')
      #   self.plot.setLabel('bottom', 'Czas')
 
-        self.sensor_id = sensor_id
+        self.range_index = DEFAULT_RANGE
+        range_row = QWidget()
+        range_layout = QHBoxLayout(range_row)
+        range_layout.setContentsMargins(0, 0, 0, 0)
+        self.range_buttons = []
+        for index, (name, span, period) in enumerate(RANGES):
+            button = QPushButton(name)
+            button.setObjectName("switch_button")
+            button.setCheckable(True)
+            button.setFixedHeight(40)
+            button.clicked.connect(lambda _, index=index: self.select_range(index))
+            range_layout.addWidget(button)
+            self.range_buttons.append(button)
+        self.range_buttons[self.range_index].setChecked(True)
+        layout.addWidget(range_row)
+
+        self.sensor_id = None
+        self.buffer = None
         self.update_interval = 60
         self.seconds_left = self.update_interval
         self.is_binary = False
+        # live = history is fetched once, new points come from the websocket (push_state)
+        self.live = live
+        self.last_live_update = None
+        self.loader = None
+        # (ts, value) pushed while history is loading, added after it (the response may be older)
+        self.live_pending = []
+        self.generation = 0
+        # state_lookup(entity_id) -> EntityState known from the websocket (device_class without REST)
+        self.state_lookup = state_lookup
+        # ws_request(payload, callback) -> False when not connected, used for long-term statistics
+        self.ws_request = ws_request
+        # raw = 6 h buffer, statistics = HA long-term statistics, history = raw history of a long range
+        self.mode = "raw"
+        self.range_data = None
+        self.statistics_loaded.connect(self.statistics_received)
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_countdown)
-        self.timer.start(1000)
 
         close_btn = QPushButton("Close")
         close_btn.setObjectName("switch_button")
@@ -176,73 +430,293 @@ class SensorChartWindow(QMainWindow):
         close_btn.setFixedHeight(60)
         close_btn.clicked.connect(self.close)
         layout.addWidget(close_btn)
-        
+
+        if sensor_id is not None:
+            self.set_sensor(sensor_id)
+
+    def set_sensor(self, sensor_id):
+        # the same window (plot, axes, style) is reused, only the data source changes
+        if sensor_id == self.sensor_id and self.isVisible():
+            return
+        self.sensor_id = sensor_id
+        self.setWindowTitle(f"Wykres: {sensor_id}")
+        self.buffer = get_history_buffer(sensor_id)
+        self.is_binary = self.buffer.is_binary or sensor_id.startswith("binary_sensor.")
+        self.last_live_update = None
+        self.live_pending = []
+        self.select_range(DEFAULT_RANGE)
+
+    def hideEvent(self, event):
+        # closed window waits hidden for the next sensor, nothing is refreshed meanwhile
+        # (spontaneous = minimized by the window manager, that one keeps running)
+        if event.spontaneous():
+            super().hideEvent(event)
+            return
+        self.timer.stop()
+        self.decimate_timer.stop()
+        if self.loader is not None:
+            history_pool.tryTake(self.loader)
+            self.loader = None
+        self.generation += 1
+        super().hideEvent(event)
+
+    def select_range(self, index):
+        for i, button in enumerate(self.range_buttons):
+            button.setChecked(i == index)
+        self.range_index = index
+        name, span, period = RANGES[index]
+
+        if span <= HISTORY_WINDOW:
+            self.mode = "raw"
+        elif period is not None and self.ws_request is not None and not self.is_binary:
+            self.mode = "statistics"
+        else:
+            self.mode = "history"
+        self.range_data = None
+
+        # long ranges change slowly, they are refreshed every 5 minutes also in live mode
+        self.update_interval = 60 if self.mode == "raw" else 300
+        if self.live and self.mode == "raw":
+            self.timer.stop()
+        elif not self.timer.isActive():
+            self.timer.start(1000)
+
+        self.plot.enableAutoRange()
         self.refresh_data()
+        self.update_plot()
 
     def refresh_data(self):
-        try:
-            self.timestamps, self.values, self.is_binary = get_sensor_history(self.sensor_id)
-        except Exception as e:
-            print(f"blad pobierania danych: {e}")
-            self.timestamps, self.values, self.is_binary = [], [], False
+        if self.loader is not None:
+            # a refresh that has not started yet is dropped, a running one is ignored on arrival
+            history_pool.tryTake(self.loader)
+            self.loader = None
+        self.generation += 1
+        self.seconds_left = self.update_interval
+
+        if self.mode == "statistics":
+            self.request_statistics()
+            return
+
+        if self.mode == "raw":
+            # tylko brakujacy kawalek od ostatniego punktu, pelne okno tylko za pierwszym razem
+            last = self.buffer.last_timestamp()
+            start_time = datetime.fromtimestamp(last, timezone.utc) if last is not None else None
+        else:
+            start_time = datetime.now(timezone.utc) - RANGES[self.range_index][1]
+
+        attributes = None
+        if self.state_lookup is not None:
+            state = self.state_lookup(self.sensor_id)
+            if state:
+                attributes = {"device_class": state.device_class}
+        self.loader = HistoryLoader(self.generation, self.sensor_id, start_time, attributes)
+        self.loader.signals.loaded.connect(self.history_loaded)
+        self.loader.signals.failed.connect(self.history_failed)
+        history_pool.start(self.loader)
+
+        if len(self.plot_data()[0]) == 0:
+            self.info_label.setText(f"{self.sensor_id} | Loading...")
+
+    def request_statistics(self):
+        name, span, period = RANGES[self.range_index]
+        now = datetime.now(timezone.utc)
+        sent = self.ws_request({
+            "type": "recorder/statistics_during_period",
+            "start_time": (now - span).isoformat(),
+            "end_time": now.isoformat(),
+            "statistic_ids": [self.sensor_id],
+            "period": period,
+            "types": ["mean", "min", "max"],
+        }, lambda msg, generation=self.generation: self.statistics_loaded.emit(generation, msg))
+
+        if not sent:
+            print("no websocket connection, raw history instead of statistics")
+            self.mode = "history"
+            self.refresh_data()
+        elif self.range_data is None:
+            self.info_label.setText(f"{self.sensor_id} | Loading...")
+
+    def statistics_received(self, generation, msg):
+        if generation != self.generation:
+            return
 
+        rows = []
+        if msg.get("success"):
+            rows = (msg.get("result") or {}).get(self.sensor_id, [])
+        else:
+            print(f"statistics error: {msg.get('error')}")
+
+        self.range_data = parse_statistics(rows)
+        if len(self.range_data[0]) == 0:
+            # sensor without state_class has no long-term statistics
+            print(f"no statistics for {self.sensor_id}, raw history instead")
+            self.mode = "history"
+            self.range_data = None
+            self.refresh_data()
+            return
         self.update_plot()
-        self.seconds_left = self.update_interval
+
+    def history_loaded(self, generation, result):
+        if generation != self.generation:
+            return
+        self.loader = None
+
+        timestamps, values, self.buffer.is_binary = result
+        self.is_binary = self.buffer.is_binary
+        if self.mode == "raw":
+            self.buffer.extend(timestamps, values)
+            self.buffer.evict(time.time())
+        else:
+            self.range_data = (timestamps, values, None, None)
+        self.apply_live_pending()
+        self.update_plot()
+
+    def history_failed(self, generation, error):
+        if generation != self.generation:
+            return
+        self.loader = None
+        print(f"blad pobierania danych: {error}")
+        self.apply_live_pending()
+        self.update_plot()
+
+    def apply_live_pending(self):
+        if not self.live_pending:
+            return
+        pending, self.live_pending = self.live_pending, []
+        # extend() skips points not newer than the history just loaded
+        self.buffer.extend([point[0] for point in pending], [point[1] for point in pending])
+        self.buffer.evict(time.time())
+        self.last_live_update = datetime.now()
+
+    def plot_data(self):
+        # x, y, min, max (min/max only for statistics)
+        if self.mode == "raw":
+            x, y = self.buffer.arrays()
+            # one point before the range, so that a step plot starts with the right state
+            first = max(np.searchsorted(x, time.time() - RANGES[self.range_index][1].total_seconds()) - 1, 0)
+            return x[first:], y[first:], None, None
+        if self.range_data is None:
+            return np.empty(0), np.empty(0), None, None
+        return self.range_data
 
     def update_plot(self):
-        if not self.timestamps or not self.values:
-            self.plot.clear()
+        x, y, low, high = self.plot_data()
+        if len(x) == 0:
+            self.show_curves(None)
             self.info_label.setText("brak danych do wyswietlenia")
             return
 
-        x = np.array([ts.timestamp() for ts in self.timestamps], dtype=float)
-        y = np.array(self.values, dtype=float)
+        if self.mode == "statistics":
+            # mean with a min/max band, a few hundred points at most
+            self.band_low.setData(x, low)
+            self.band_high.setData(x, high)
+            self.line_curve.setData(x, y)
+            self.show_curves("statistics")
+        elif self.is_binary:
+            xd, yd = self.decimated(x, y)
+            self.step_curve.setData(self.step_x(xd), yd)
+            self.show_curves("binary")
+        else:
+            xd, yd = self.decimated(x, y)
+            self.line_curve.setData(xd, yd)
+            self.show_curves("line")
 
-        self.plot.clear()
+        self.update_info_label()
 
-        if self.is_binary:
-            if len(x) > 1:
-                delta = x[-1] - x[-2]
-            else:
-                delta = 60
-            x_extended = np.append(x, x[-1] + delta)
-
-            self.plot.plot(x_extended, y, stepMode=True, fillLevel=0, brush=(0, 128, 255, 100), pen=pg.mkPen(color='#0077CC', width=2))
-            ticks = [(0, "OFF"), (1, "ON")]
-            self.plot.getAxis('left').setTicks([ticks])
+    def show_curves(self, style):
+        # style: None (no data), "line", "binary" or "statistics"
+        if style == self.plot_style:
+            return
+        self.plot_style = style
+        self.line_curve.setVisible(style in ("line", "statistics"))
+        self.step_curve.setVisible(style == "binary")
+        self.band.setVisible(style == "statistics")
+        self.curve = {"line": self.line_curve, "binary": self.step_curve}.get(style)
+
+        if style == "binary":
+            self.plot.getAxis('left').setTicks([[(0, "OFF"), (1, "ON")]])
             self.plot.setYRange(-0.1, 1.1)
         else:
-            self.plot.plot(x, y, pen=pg.mkPen(color='#1c9bf0', width=2))
-            min_val = np.min(y)
-            max_val = np.max(y)
-            margin = (max_val - min_val) * 0.1 if max_val != min_val else 1
-        #    self.plot.setYRange(min_val - margin, max_val + margin)
-
-        max_ticks = 10
-        total_points = len(self.timestamps)
-
-        if total_points <= max_ticks:
-            ticks = [(ts.timestamp(), datetime.fromtimestamp(ts.timestamp()).strftime("%H:%M")) for ts in self.timestamps]
+            self.plot.getAxis('left').setTicks(None)
+            self.plot.enableAutoRange(axis='y')
+
+    def step_x(self, x):
+        # stepMode needs one x more than y, the last state lasts until now
+        return np.append(x, max(time.time(), x[-1] + 60))
+
+    def decimated(self, x, y):
+        view_box = self.plot.getViewBox()
+        if not view_box.autoRangeEnabled()[0]:
+            # zoomed in: only the visible part (plus one point on each side)
+            low, high = view_box.viewRange()[0]
+            first = max(np.searchsorted(x, low) - 1, 0)
+            last = min(np.searchsorted(x, high) + 1, len(x))
+            x, y = x[first:last], y[first:last]
+        return decimate(x, y, max(int(view_box.width()), 100), self.is_binary)
+
+    def view_changed(self):
+        if self.curve is not None and not self.plot.getViewBox().autoRangeEnabled()[0]:
+            self.decimate_timer.start()
+
+    def redecimate(self):
+        x, y, low, high = self.plot_data()
+        if self.curve is None or len(x) == 0:
+            return
+        xd, yd = self.decimated(x, y)
+        if len(xd) == 0:
+            return
+        if self.is_binary:
+            self.curve.setData(self.step_x(xd), yd)
         else:
-            step = max(1, total_points // max_ticks)
-            ticks = [(ts.timestamp(), datetime.fromtimestamp(ts.timestamp()).strftime("%H:%M"))
-                     for i, ts in enumerate(self.timestamps) if i % step == 0]
-
-        self.plot.getAxis('bottom').setTicks([ticks])
+            self.curve.setData(xd, yd)
 
+    def update_info_label(self):
+        if self.live and self.mode == "raw":
+            last = self.last_live_update or datetime.now()
+            self.info_label.setText(f"{self.sensor_id} | Live | Last value: {last.strftime('%H:%M:%S')}")
+            return
         now = datetime.now().strftime("%H:%M")
         self.info_label.setText(f"{self.sensor_id} | Last update: {now} | Next updat in: {self.seconds_left}s")
 
+    def push_state(self, state_obj):
+        if not self.live or not self.isVisible():
+            return
+        is_binary = self.buffer.is_binary or self.sensor_id.startswith("binary_sensor.")
+        value = state_to_value(state_obj.state, is_binary)
+        if value is None:
+            return
+
+        now = time.time()
+        if self.loader is not None:
+            # HA may have built the history response before this change, it is added in history_loaded
+            self.live_pending.append((now, value))
+            return
+        self.buffer.extend([now], [value])
+        self.buffer.evict(now)
+        self.last_live_update = datetime.now()
+        if self.mode == "raw":
+            self.update_plot()
+
     def update_countdown(self):
         self.seconds_left -= 1
         if self.seconds_left <= 0:
             self.refresh_data()
         else:
-            now = datetime.now().strftime("%H:%M")
-            self.info_label.setText(f"{self.sensor_id} | Last update: {now} | Next updat in: {self.seconds_left}s")
+            self.update_info_label()
+
+
+chart_window = None
+
+
+def prewarm_chart_window(live=False, state_lookup=None, ws_request=None):
+    # hidden window built ahead of time, show_sensor_graph only swaps the sensor
+    global chart_window
+    if chart_window is None:
+        chart_window = SensorChartWindow(None, live, state_lookup, ws_request)
+    return chart_window
 
 
-def show_sensor_graph(sensor_id: str):
+def show_sensor_graph(sensor_id: str, live=False, state_lookup=None, ws_request=None):
     app = QApplication.instance()
     created_app = False
 
@@ -250,7 +724,8 @@ def show_sensor_graph(sensor_id: str):
         app = QApplication(sys.argv)
         created_app = True
 
-    window = SensorChartWindow(sensor_id)
+    window = prewarm_chart_window(live, state_lookup, ws_request)
+    window.set_sensor(sensor_id)
     window.show()
 
     if created_app:
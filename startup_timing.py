@@ -0,0 +1,39 @@
+import json
+import time
+from datetime import datetime
+
+
+# Czasy startu liczone od zaimportowania tego modulu (pierwszy import w ha_autogenerate).
+# STARTUP_STEPS are reported together once all of them happened.
+
+STARTUP_STEPS = ("imports", "widgets", "first_paint", "first_state")
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = {}
+        self.log_path = None
+
+    def mark(self, name):
+        if name in self.marks:
+            return
+        self.marks[name] = time.perf_counter() - self.started
+        if all(step in self.marks for step in STARTUP_STEPS):
+            self.report()
+
+    def report(self):
+        print("startup: " + ", ".join(f"{step} {self.marks[step]:.3f}s" for step in STARTUP_STEPS))
+        if not self.log_path:
+            return
+        # one JSON line per start, easy to compare between releases
+        entry = {"time": datetime.now().isoformat(timespec="seconds"),
+                 **{step: round(self.marks[step], 4) for step in STARTUP_STEPS}}
+        try:
+            with open(self.log_path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"startup log error: {e}")
+
+
+startup = StartupTimer()
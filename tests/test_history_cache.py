@@ -0,0 +1,98 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from app_config import config
+
+# the real history_cache.sqlite is not touched, every test gets its own store
+config["history_cache"] = ""
+
+import ha_codec
+import sensor_graph
+from history_store import HistoryStore
+
+HOUR = 3600
+ATTRIBUTES = {"device_class": "door"}
+
+
+class Response:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeRest:
+    # answers like /api/history/period: the state at start_time first, then the changes after it
+    def __init__(self, changes):
+        self.changes = changes
+        self.requests = []
+
+    def get(self, path, params):
+        start = datetime.fromisoformat(path.rsplit("/", 1)[1]).timestamp()
+        self.requests.append(start)
+        earlier = [state for ts, state in self.changes if ts <= start]
+        entries = [(start, earlier[-1])] if earlier else []
+        entries += [(ts, state) for ts, state in self.changes if ts > start]
+        data = [{"state": state, "last_changed": datetime.fromtimestamp(ts, timezone.utc).isoformat()}
+                for ts, state in entries]
+        return Response(ha_codec.dumps([data]).encode())
+
+
+def open_chart(monkeypatch, changes, now):
+    rest = FakeRest(changes)
+    monkeypatch.setattr(sensor_graph, "rest_client", rest)
+    monkeypatch.setattr(sensor_graph.time, "time", lambda: now)
+    timestamps, values, _ = sensor_graph.get_sensor_history("binary_sensor.door", None, ATTRIBUTES)
+    return timestamps, values, rest
+
+
+def make_store(monkeypatch, tmp_path):
+    store = HistoryStore(str(tmp_path / "cache.sqlite"))
+    store.start()
+    monkeypatch.setattr(sensor_graph, "history_store", store)
+    return store
+
+
+def test_reopened_chart_keeps_value_at_window_start(monkeypatch, tmp_path):
+    make_store(monkeypatch, tmp_path)
+    now = 1_700_000_000.0
+    window = sensor_graph.HISTORY_WINDOW.total_seconds()
+    # the door was closed three days ago and has not changed since
+    changes = [(now - 72 * HOUR, "off")]
+
+    timestamps, values, _ = open_chart(monkeypatch, changes, now)
+    assert list(values) == [0.0]
+
+    # one hour later the window has moved, only the gap is downloaded
+    timestamps, values, rest = open_chart(monkeypatch, changes, now + HOUR)
+    assert rest.requests == [now]
+    assert list(values) == [0.0]
+    assert timestamps[0] == now + HOUR - window
+
+
+def test_reopened_chart_without_cache_matches(monkeypatch, tmp_path):
+    monkeypatch.setattr(sensor_graph, "history_store", None)
+    now = 1_700_000_000.0
+    changes = [(now - 72 * HOUR, "off"), (now - 2 * HOUR, "on")]
+
+    _, values, _ = open_chart(monkeypatch, changes, now + HOUR)
+    make_store(monkeypatch, tmp_path)
+    open_chart(monkeypatch, changes, now)
+    _, cached_values, _ = open_chart(monkeypatch, changes, now + HOUR)
+    assert list(cached_values) == list(values) == [0.0, 1.0]
+
+
+def test_prune_keeps_value_at_cutoff(tmp_path):
+    store = HistoryStore(str(tmp_path / "cache.sqlite"), retention_hours=1)
+    store.start()
+    now = datetime.now(timezone.utc).timestamp()
+    store.save("sensor.temp", [now - 5 * HOUR, now - 3 * HOUR], [20.0, 21.0], now, now - 6 * HOUR)
+    store.prune()
+
+    timestamps, values, _ = store.load("sensor.temp", now - 0.5 * HOUR)
+    assert values == [21.0]
+    assert timestamps == [now - 0.5 * HOUR]
@@ -0,0 +1,53 @@
+import time
+from PyQt5.QtCore import QObject, QTimer
+
+
+# Jeden wspolny throttle dla suwakow. Pierwsza zmiana idzie od razu (leading edge),
+# kolejne w czasie interwalu sa laczone i wysylana jest tylko ostatnia (trailing edge).
+# Klucz = (entity_id, atrybut), wiec jasnosc, temperatura i barwa tej samej lampy sie nie nadpisuja.
+
+class ThrottleScheduler(QObject):
+    def __init__(self, interval_ms, parent=None):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000
+        # key -> [next_allowed, callback, args, pending]
+        self.entries = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def submit(self, key, callback, *args):
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is None or now >= entry[0]:
+            self.entries[key] = [now + self.interval, callback, args, False]
+            callback(*args)
+            return
+
+        entry[1] = callback
+        entry[2] = args
+        entry[3] = True
+        self.arm(entry[0] - now)
+
+    def arm(self, delay):
+        # one timer for all keys, set to the earliest trailing call
+        delay_ms = max(int(delay * 1000) + 1, 0)
+        if not self.timer.isActive() or self.timer.remainingTime() > delay_ms:
+            self.timer.start(delay_ms)
+
+    def flush(self):
+        # entries stay after their trailing call (one per slider), a late change is a leading edge again
+        now = time.monotonic()
+        next_due = None
+        for entry in list(self.entries.values()):
+            if not entry[3]:
+                continue
+            if now >= entry[0]:
+                entry[0] = now + self.interval
+                entry[3] = False
+                entry[1](*entry[2])
+            else:
+                due = entry[0] - now
+                next_due = due if next_due is None else min(next_due, due)
+        if next_due is not None:
+            self.arm(next_due)
@@ -0,0 +1,277 @@
+import os
+import zlib
+import struct
+import base64
+import hashlib
+
+
+# Ramki websocket (RFC 6455) bez zadnego I/O: handshake, kodowanie ramek i parser przyrostowy.
+# Wspolne dla lokalnego serwera HA (mock_ha_server.py) i klientow, ktore same obsluguja gniazdo.
+# Kompresja permessage-deflate (RFC 7692), gdy obie strony ja wynegocjuja.
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+DEFLATE_OFFER = "permessage-deflate; client_max_window_bits"
+# end of a Z_SYNC_FLUSH block, removed from every compressed message and added back before decompressing
+DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def new_key():
+    return base64.b64encode(os.urandom(16)).decode()
+
+
+def accept_key(key):
+    digest = hashlib.sha1((key + GUID).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+
+def parse_http_head(head):
+    # head = bytes up to the empty line: (first line, headers with lowercase names)
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+def client_handshake(host, path, key, extra_headers=None):
+    lines = [
+        f"GET {path} HTTP/1.1",
+        f"Host: {host}",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        f"Sec-WebSocket-Key: {key}",
+        "Sec-WebSocket-Version: 13",
+    ]
+    for name, value in (extra_headers or {}).items():
+        lines.append(f"{name}: {value}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def check_server_handshake(status_line, headers, key):
+    if " 101" not in status_line:
+        raise ProtocolError(f"handshake rejected: {status_line}")
+    if headers.get("sec-websocket-accept") != accept_key(key):
+        raise ProtocolError("wrong Sec-WebSocket-Accept")
+
+
+def server_handshake(headers, extra_headers=None):
+    key = headers.get("sec-websocket-key")
+    if not key or headers.get("upgrade", "").lower() != "websocket":
+        raise ProtocolError("not a websocket handshake")
+    lines = [
+        "HTTP/1.1 101 Switching Protocols",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        f"Sec-WebSocket-Accept: {accept_key(key)}",
+    ]
+    for name, value in (extra_headers or {}).items():
+        lines.append(f"{name}: {value}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def parse_extensions(header):
+    # "permessage-deflate; client_max_window_bits=10, x-other" -> [(name, {parameter: value or None})]
+    extensions = []
+    for item in header.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        if not parts[0]:
+            continue
+        params = {}
+        for part in parts[1:]:
+            name, _, value = part.partition("=")
+            params[name.strip()] = value.strip().strip('"') or None
+        extensions.append((parts[0], params))
+    return extensions
+
+
+def format_extension(name, params):
+    return "; ".join([name] + [key if value is None else f"{key}={value}" for key, value in params.items()])
+
+
+class PerMessageDeflate:
+    # permessage-deflate (RFC 7692) of one connection. With context takeover the dictionary stays between
+    # messages, so keys and entity ids repeated in every event compress to a few bytes
+    def __init__(self, is_client, params):
+        # params = parameters of the server response (what both sides agreed on)
+        own, peer = ("client", "server") if is_client else ("server", "client")
+        self.compress_reset = f"{own}_no_context_takeover" in params
+        self.decompress_reset = f"{peer}_no_context_takeover" in params
+        # zlib cannot write raw deflate with an 8 bit window
+        self.window_bits = min(max(int(params.get(f"{own}_max_window_bits") or 15), 9), 15)
+        self.compressor = None
+        self.decompressor = None
+
+    def compress(self, data):
+        if self.compressor is None or self.compress_reset:
+            self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -self.window_bits)
+        data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-4] if data.endswith(DEFLATE_TAIL) else data
+
+    def decompress(self, data, max_size):
+        if self.decompressor is None or self.decompress_reset:
+            self.decompressor = zlib.decompressobj(-15)
+        result = self.decompressor.decompress(data + DEFLATE_TAIL, max_size)
+        if self.decompressor.unconsumed_tail:
+            raise ProtocolError(f"message bigger than {max_size} bytes after decompression")
+        return result
+
+
+def server_deflate(headers):
+    # (Sec-WebSocket-Extensions answer, PerMessageDeflate) when the client offered compression, else (None, None)
+    for name, offer in parse_extensions(headers.get("sec-websocket-extensions", "")):
+        if name != "permessage-deflate":
+            continue
+        params = {key: None for key in ("server_no_context_takeover", "client_no_context_takeover") if key in offer}
+        if offer.get("server_max_window_bits"):
+            params["server_max_window_bits"] = offer["server_max_window_bits"]
+        return format_extension(name, params), PerMessageDeflate(False, params)
+    return None, None
+
+
+def client_deflate(headers):
+    # PerMessageDeflate when the server accepted the offer, None = no compression
+    for name, params in parse_extensions(headers.get("sec-websocket-extensions", "")):
+        if name == "permessage-deflate":
+            return PerMessageDeflate(True, params)
+    return None
+
+
+def apply_mask(data, key):
+    # xor of the whole payload as one big integer, many times faster than a loop over bytes
+    length = len(data)
+    if not length:
+        return b""
+    repeated = (key * (length // 4 + 1))[:length]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(repeated, "big")).to_bytes(length, "big")
+
+
+def encode_frame(opcode, payload, mask=False, fin=True, rsv1=False):
+    # frames from a client must be masked, frames from a server must not; rsv1 = compressed message
+    if isinstance(payload, str):
+        payload = payload.encode()
+    length = len(payload)
+    header = bytearray([(0x80 if fin else 0) | (0x40 if rsv1 else 0) | opcode])
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 65536:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", length)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = apply_mask(payload, key)
+    return bytes(header) + payload
+
+
+def encode_message(opcode, payload, mask=False, deflate=None):
+    # whole message in one frame, compressed when permessage-deflate was negotiated
+    if deflate is None:
+        return encode_frame(opcode, payload, mask)
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return encode_frame(opcode, deflate.compress(payload), mask, rsv1=True)
+
+
+def encode_close(code=CLOSE_NORMAL, reason="", mask=False):
+    return encode_frame(OP_CLOSE, struct.pack("!H", code) + reason.encode(), mask)
+
+
+def close_code(payload):
+    return struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else None
+
+
+class FrameParser:
+    # bytes in (feed), whole messages out as (opcode, payload); fragments are joined and decompressed,
+    # control frames (close, ping, pong) are returned as they come, also between fragments
+    def __init__(self, max_size=64 * 1024 * 1024, deflate=None):
+        self.max_size = max_size
+        self.deflate = deflate
+        self.buffer = bytearray()
+        self.fragments = None
+        self.fragment_opcode = None
+        self.compressed = False
+
+    def feed(self, data):
+        self.buffer += data
+        messages = []
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return messages
+            fin, rsv1, opcode, payload = frame
+            if opcode >= OP_CLOSE:
+                messages.append((opcode, payload))
+                continue
+            if opcode == OP_CONTINUATION:
+                if self.fragments is None:
+                    raise ProtocolError("continuation frame without a first frame")
+                self.fragments.append(payload)
+            else:
+                if self.fragments is not None:
+                    raise ProtocolError("new message inside a fragmented one")
+                if rsv1 and self.deflate is None:
+                    raise ProtocolError("compressed frame without permessage-deflate")
+                self.fragment_opcode = opcode
+                self.compressed = rsv1
+                self.fragments = [payload]
+            if fin:
+                payload = b"".join(self.fragments)
+                if self.compressed:
+                    payload = self.deflate.decompress(payload, self.max_size)
+                messages.append((self.fragment_opcode, payload))
+                self.fragments = None
+
+    def next_frame(self):
+        buffer = self.buffer
+        if len(buffer) < 2:
+            return None
+        first, second = buffer[0], buffer[1]
+        length = second & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return None
+            length = struct.unpack_from("!H", buffer, 2)[0]
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return None
+            length = struct.unpack_from("!Q", buffer, 2)[0]
+            offset = 10
+        if length > self.max_size:
+            raise ProtocolError(f"frame of {length} bytes is too big")
+
+        key = None
+        if second & 0x80:
+            key = bytes(buffer[offset:offset + 4])
+            offset += 4
+        if len(buffer) < offset + length:
+            return None
+
+        payload = bytes(buffer[offset:offset + length])
+        del buffer[:offset + length]
+        if key is not None:
+            payload = apply_mask(payload, key)
+        return bool(first & 0x80), bool(first & 0x40), first & 0x0F, payload